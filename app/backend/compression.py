@@ -0,0 +1,84 @@
+import gzip
+from typing import List, Tuple
+from .config import COMPRESSION_MIN_BYTES, GZIP_LEVEL, BROTLI_QUALITY
+
+try:
+    import brotli  # Optional: enables 'br' encoding
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+
+def choose_encoding(accept_encoding: str) -> str:
+    """Prefers brotli when the client accepts it and the module is installed."""
+    accepted = {part.split(";")[0].strip().lower() for part in accept_encoding.split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return ""
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware that gzip/brotli-compresses single-chunk responses above a size threshold.
+    Streaming responses (more_body=True) are passed through untouched.
+    """
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if not encoding:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+
+        async def send_wrapper(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message  # Hold until we see the body
+                return
+
+            if message["type"] == "http.response.body" and start_message is not None:
+                start, start_message = start_message, None
+                body = message.get("body", b"")
+                if not message.get("more_body", False) and self._should_compress(start["headers"], body):
+                    body = compress(body, encoding)
+                    start["headers"] = self._rewrite_headers(start["headers"], encoding, len(body))
+                    message = {**message, "body": body}
+                await send(start)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _should_compress(self, raw_headers: List[Tuple[bytes, bytes]], body: bytes) -> bool:
+        if len(body) < self.minimum_size:
+            return False
+        headers = {k.lower(): v for k, v in raw_headers}
+        if b"content-encoding" in headers:
+            return False
+        content_type = headers.get(b"content-type", b"").decode("latin-1")
+        return content_type.startswith(COMPRESSIBLE_TYPES)
+
+    def _rewrite_headers(self, raw_headers, encoding: str, length: int):
+        vary = [v for k, v in raw_headers if k.lower() == b"vary"]
+        kept = [(k, v) for k, v in raw_headers if k.lower() not in (b"content-length", b"vary")]
+        kept.append((b"content-encoding", encoding.encode()))
+        kept.append((b"content-length", str(length).encode()))
+        kept.append((b"vary", b", ".join(vary + [b"Accept-Encoding"])))
+        return kept
@@ -5,3 +5,66 @@ DB_FILE = os.path.join(BASE_DIR, "../req_10_sqlite_drugbank.db")
 
 OLLAMA_URL = "http://localhost:11434/api/generate"  # Ollama URL
 MODEL_NAME = "llama3.1:8b"  # Ollama model
+MODEL_CONTEXT_TOKENS = 2048  # Context window Ollama runs the model with (num_ctx)
+SEVERITY_BATCH_MAX = 10  # Max interactions packed into one severity prompt
+CONTEXT_FIELD_TOKENS = 80  # Budget per condensed pharmacology field (drug_context table)
+MAX_PROMPT_TOKENS = 1024  # Hard cap on recommendation/risk prompt size
+
+# Ollama backend pool: comma-separated generate URLs, e.g.
+# OLLAMA_URLS="http://10.0.0.5:11434/api/generate,http://10.0.0.6:11434/api/generate"
+OLLAMA_URLS = [u.strip() for u in os.getenv("OLLAMA_URLS", OLLAMA_URL).split(",") if u.strip()]
+OLLAMA_MAX_CONCURRENCY = 1  # In-flight requests per backend (CPU-only boxes serialize anyway)
+OLLAMA_TIMEOUT_S = 120  # Per-request HTTP timeout
+OLLAMA_HEALTH_INTERVAL_S = 10  # Seconds between health checks
+OLLAMA_FAILURE_THRESHOLD = 3  # Consecutive failures before a backend is ejected
+OLLAMA_KEEP_ALIVE = "30m"  # How long Ollama keeps MODEL_NAME loaded after a call
+
+# LLM admission control (scheduler in front of the pool)
+LLM_WORKERS = len(OLLAMA_URLS) * OLLAMA_MAX_CONCURRENCY  # Matches total backend capacity
+LLM_QUEUE_MAX = 64  # Queued calls beyond this are shed, least urgent first
+LLM_DEADLINES_S = {"interactive": 20, "standard": 60, "background": 90, "bulk": 900, "speculative": 30}  # Per-call, from enqueue
+ANALYSIS_DEADLINE_S = 120  # Total LLM time budget for one /analyze/* request
+SEVERITY_CACHE_SIZE = 5000  # Severity per interaction description (deterministic at temp 0)
+
+# Query tracing (DatabaseManager)
+DB_TRACE_QUERIES = True  # Record normalized SQL, wall time and row count per statement
+SLOW_QUERY_MS = 50  # Statements slower than this are logged with their EXPLAIN QUERY PLAN
+TRACE_RECENT_REQUESTS = 50  # Per-request traces kept for /debug/queries
+
+# Response compression
+COMPRESSION_MIN_BYTES = 1024  # Smaller bodies aren't worth the CPU
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # Brotli is used when installed and the client accepts 'br'
+
+# Startup warm-up (gates /ready)
+CONTEXT_CACHE_SIZE = 2048  # Drug contexts kept in memory (LRU)
+PREWARM_CONTEXT_TOP_N = 100  # Preload contexts for the N most-interacting drugs (0 disables)
+
+# Bucketed risk assessments (opt-in per request)
+RISK_CACHE_SIZE = 5000  # (pair, patient bucket) results kept in memory (LRU)
+
+# Bulk medication-review jobs
+JOBS_DIR = os.path.join(BASE_DIR, "../jobs")  # NDJSON result files
+JOB_WORKERS = 2  # Jobs processed concurrently (each keeps at most one bulk LLM call queued)
+JOB_CHUNK_SIZE = 200  # Rows whose DB lookups and LLM calls are batched together
+JOB_MAX_ROWS = 50000
+JOB_MAX_MEDICATIONS = 20  # Per row; pairs grow quadratically
+JOB_OVERLOAD_RETRIES = 5  # Shed bulk LLM calls are re-queued this many times before falling back
+JOB_OVERLOAD_BACKOFF_S = 5  # Doubled after each retry
+JOB_RETENTION_S = 7 * 24 * 3600  # Finished jobs and their result files are deleted after this
+JOB_MAX_RETAINED = 100  # Finished jobs kept at most (oldest deleted first)
+
+# Autocomplete (/search)
+SEARCH_RESULT_LIMIT = 10  # Suggestions returned per query
+SEARCH_TABLE_LIMIT = 50  # Rows read per table; truncated candidate sets aren't kept for narrowing
+SEARCH_SESSION_CACHE_SIZE = 1000  # Concurrent search sessions kept (LRU)
+SEARCH_SESSION_TTL_S = 120  # A session's candidate set expires after this long
+SEARCH_CACHE_MAX_AGE_S = 3600  # Cache-Control max-age; results only change when the DB is rebuilt
+
+# Speculative precompute (/analyze/interactions queues work the report will need)
+SPECULATIVE_PRECOMPUTE = True  # Severity, mechanism summaries and drug contexts; unclaimed calls expire after LLM_DEADLINES_S["speculative"]
+SPECULATIVE_MAX_PENDING = 64  # Speculative results waiting to be claimed; no new speculation beyond this
+
+# Materialized per-drug documents (built by SQL_Builder into drug_documents)
+REFERENCES_PER_TYPE = 5  # Articles/links/attachments/books kept per drug
+DOCUMENT_ZLIB_LEVEL = 9  # Build-time only; decompression cost doesn't depend on it
@@ -1,11 +1,100 @@
+import re
 import sqlite3
-from typing import List
-from .config import DB_FILE
+import threading
+import time
+import contextvars
+from collections import deque
+from typing import List, Dict, Optional
+from .config import DB_FILE, DB_TRACE_QUERIES, SLOW_QUERY_MS, TRACE_RECENT_REQUESTS
+from .metrics import record_db_query
+
+# Statements executed during the current request (None when not tracing)
+_request_trace: contextvars.ContextVar[Optional[List[Dict]]] = contextvars.ContextVar(
+    "request_trace", default=None
+)
+
+_WHITESPACE = re.compile(r"\s+")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+def normalize_sql(sql: str) -> str:
+    """Collapses whitespace and variable-length IN (?, ?, ...) lists so equal statements group together."""
+    sql = _WHITESPACE.sub(" ", sql).strip()
+    return _PLACEHOLDER_LIST.sub("(?...)", sql)
+
+
+class QueryTracer:
+    """Aggregates per-statement timings and keeps the traces of recent requests."""
+    def __init__(self, slow_query_ms: float = SLOW_QUERY_MS, recent: int = TRACE_RECENT_REQUESTS):
+        self.slow_query_ms = slow_query_ms
+        self._stats: Dict[str, Dict] = {}
+        self._recent = deque(maxlen=recent)
+        self._lock = threading.Lock()
+
+    def record(self, sql: str, elapsed_ms: float, rows: int) -> bool:
+        """Returns True the first time a normalized statement is seen (it has no plan yet)."""
+        with self._lock:
+            entry = self._stats.get(sql)
+            first_seen = entry is None
+            if entry is None:
+                entry = {"sql": sql, "calls": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0}
+                self._stats[sql] = entry
+            entry["calls"] += 1
+            entry["total_ms"] += elapsed_ms
+            entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+            entry["rows"] += rows
+
+        trace = _request_trace.get()
+        if trace is not None:
+            trace.append({"sql": sql, "ms": round(elapsed_ms, 3), "rows": rows})
+        return first_seen
+
+    def attach_plan(self, sql: str, plan: List[str]):
+        with self._lock:
+            if sql in self._stats:
+                self._stats[sql]["plan"] = plan
+
+    def top(self, limit: int = 10) -> List[Dict]:
+        with self._lock:
+            entries = [dict(e) for e in self._stats.values()]
+        entries.sort(key=lambda e: e["total_ms"], reverse=True)
+        for e in entries:
+            e["avg_ms"] = round(e["total_ms"] / e["calls"], 3)
+            e["total_ms"] = round(e["total_ms"], 3)
+            e["max_ms"] = round(e["max_ms"], 3)
+        return entries[:limit]
+
+    def recent_requests(self) -> List[Dict]:
+        with self._lock:
+            return list(self._recent)
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._recent.clear()
+
+    # Per-request trace lifecycle (driven by the HTTP middleware)
+    def start_request(self):
+        return _request_trace.set([])
+
+    def end_request(self, token, label: str):
+        trace = _request_trace.get() or []
+        _request_trace.reset(token)
+        if trace:
+            with self._lock:
+                self._recent.append({
+                    "request": label,
+                    "queries": len(trace),
+                    "total_ms": round(sum(t["ms"] for t in trace), 3),
+                    "statements": trace
+                })
+
 
 class DatabaseManager:
     """Handles low-level SQL connections and queries."""
-    def __init__(self, db_file=DB_FILE):
+    def __init__(self, db_file=DB_FILE, trace: bool = DB_TRACE_QUERIES):
         self.db_file = db_file
+        self.trace = trace
+        self.tracer = QueryTracer()
 
     def get_connection(self):
         # check_same_thread=False is needed for FastAPI concurrency
@@ -16,8 +105,53 @@ class DatabaseManager:
     def query(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
         with self.get_connection() as conn:
             cursor = conn.cursor()
+            if not self.trace:
+                cursor.execute(sql, params)
+                return cursor.fetchall()
+
+            start = time.perf_counter()
             cursor.execute(sql, params)
-            return cursor.fetchall()
+            rows = cursor.fetchall()
+            elapsed_ms = (time.perf_counter() - start) * 1000
+
+            normalized = normalize_sql(sql)
+            first_seen = self.tracer.record(normalized, elapsed_ms, len(rows))
+            record_db_query(elapsed_ms / 1000)
+            if first_seen:
+                # Plan every statement once, so /debug/queries shows which index each one uses
+                self.tracer.attach_plan(normalized, self._explain(conn, sql, params))
+            if elapsed_ms >= self.tracer.slow_query_ms:
+                self._log_slow_query(conn, sql, params, normalized, elapsed_ms, len(rows))
+            return rows
+
+    def warm(self, targets: List[tuple]) -> List[str]:
+        """
+        Reads (table, column, index) targets end to end so their pages land in the OS cache.
+        Index targets are scanned through the index; index=None reads the table itself.
+        """
+        warmed = []
+        for table, column, index in targets:
+            hint = f" INDEXED BY {index}" if index else ""
+            try:
+                self.query(f"SELECT COUNT({column}) FROM {table}{hint}")
+                warmed.append(index or table)
+            except sqlite3.Error as e:
+                print(f"Warm-up skipped {index or table}: {e}")
+        return warmed
+
+    def _explain(self, conn, sql: str, params: tuple) -> List[str]:
+        try:
+            plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+            return [row['detail'] for row in plan]
+        except sqlite3.Error as e:
+            return [f"EXPLAIN failed: {e}"]
+
+    def _log_slow_query(self, conn, sql, params, normalized, elapsed_ms, rows):
+        plan = self._explain(conn, sql, params)
+        self.tracer.attach_plan(normalized, plan)
+        print(f"Slow Query ({elapsed_ms:.1f} ms, {rows} rows): {normalized}")
+        for line in plan:
+            print(f"   -> {line}")
 
 # Global instance to be imported by services
-db_manager = DatabaseManager()
\ No newline at end of file
+db_manager = DatabaseManager()
@@ -1,6 +1,11 @@
-from fastapi import FastAPI, HTTPException, Query
+import time
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Request, Header, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
+from fastapi.responses import PlainTextResponse, ORJSONResponse, StreamingResponse
+from typing import List, Optional
 from .schemas import (
     MedsRequest, IDRequest, AnalysisRequest, ReportRequest,
     InteractionResponse, FoodResponse, ReferenceResponse, ReportResponse, SeverityResponse,
@@ -10,9 +15,82 @@ from .schemas import (
 from .services.resolver import DrugResolver
 from .services.interaction import InteractionEngine
 from .services.summarizer import ClinicalSummarizer
+from .services.ollama_pool import ollama_pool
+from .services.scheduler import llm_scheduler, request_deadline
+from .services.jobs import JobManager, JobInputError, parse_rows
+from .services.search import DrugSearch
+from .services.documents import drug_documents
 from .database import db_manager
+from .metrics import metrics, span, start_request, end_request
+from .compression import CompressionMiddleware
+from .config import PREWARM_CONTEXT_TOP_N, OLLAMA_HEALTH_INTERVAL_S, ANALYSIS_DEADLINE_S, SEARCH_CACHE_MAX_AGE_S, SPECULATIVE_PRECOMPUTE
 
-app = FastAPI(title="Medication Interaction Checker")
+# Hot tables/indexes touched on startup: (table, column, index or None for the table itself)
+WARM_TARGETS = [
+    ("drug_interactions", "drugbank_id", "idx_drug_interactions_pk"),
+    ("drug_interactions", "target_drugbank_id", "idx_inter_target"),
+    ("drug_interactions", "description", None),
+    ("general_info", "name", "idx_gen_name"),
+    ("general_info", "description", None),
+    ("synonyms", "synonym", "idx_syn_name"),
+    ("mixtures", "name", "idx_mix_name"),
+    ("food_interactions", "drugbank_id", "idx_food_interactions_pk"),
+    ("drug_documents", "drugbank_id", "idx_drug_documents_pk"),
+    ("pharmacology", "drugbank_id", "idx_pharmacology_pk"),
+    ("drug_context", "drugbank_id", "idx_drug_context_pk"),
+]
+
+# Flipped by warm_up(); /ready reports 503 until then
+readiness = {"ready": False, "steps": {}}
+_warm_stop = threading.Event()
+
+def warm_model() -> bool:
+    try:
+        results = summarizer.warm_up()
+    except Exception as e:
+        results = f"failed: {e}"
+    readiness["steps"]["model"] = results
+    return isinstance(results, list) and any(r["ok"] for r in results)
+
+def warm_up():
+    started = time.perf_counter()
+    try:
+        readiness["steps"]["database"] = db_manager.warm(WARM_TARGETS)
+    except Exception as e:
+        readiness["steps"]["database"] = f"failed: {e}"
+
+    if PREWARM_CONTEXT_TOP_N:
+        try:
+            readiness["steps"]["contexts"] = summarizer.preload_contexts(PREWARM_CONTEXT_TOP_N)
+        except Exception as e:
+            readiness["steps"]["contexts"] = f"failed: {e}"
+
+    # Not ready until the model is loaded on at least one backend; retry at the health-check cadence
+    attempts = 1
+    while not warm_model():
+        readiness["steps"]["model_attempts"] = attempts
+        print(f"Model warm-up failed on every backend (attempt {attempts}); retrying in {OLLAMA_HEALTH_INTERVAL_S}s")
+        if _warm_stop.wait(OLLAMA_HEALTH_INTERVAL_S):
+            return
+        attempts += 1
+    readiness["steps"]["model_attempts"] = attempts
+
+    readiness["warm_up_seconds"] = round(time.perf_counter() - started, 2)
+    readiness["ready"] = True
+    print(f"Warm-up complete in {readiness['warm_up_seconds']}s")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Background health checks eject/re-admit Ollama backends
+    ollama_pool.start()
+    # Warm caches off the event loop so /ready (and liveness) answer meanwhile
+    warm_task = asyncio.create_task(asyncio.to_thread(warm_up))
+    yield
+    _warm_stop.set()
+    warm_task.cancel()
+    ollama_pool.stop()
+
+app = FastAPI(title="Medication Interaction Checker", lifespan=lifespan, default_response_class=ORJSONResponse)
 
 
 
@@ -23,209 +101,267 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*", "ngrok-skip-browser-warning"],  # Explicitly allow ngrok header
+    expose_headers=["Server-Timing"],
 )
 
-#2. Initialize Services
+#2. Compression (gzip/brotli above COMPRESSION_MIN_BYTES; matters over the ngrok tunnel)
+app.add_middleware(CompressionMiddleware)
+
+# Per-request latency: stage spans -> Server-Timing header, totals -> /metrics
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    token = start_request()
+    trace_token = db_manager.tracer.start_request()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        elapsed = time.perf_counter() - start
+        timing = end_request(token)
+        # Label by route template (not raw path) to keep cardinality bounded
+        route = request.scope.get("route")
+        route_path = getattr(route, "path", "unmatched")
+        db_manager.tracer.end_request(trace_token, f"{request.method} {route_path}")
+        metrics.request_seconds.observe(elapsed, request.method, route_path, str(status))
+
+    total = f"total;dur={elapsed * 1000:.1f}"
+    response.headers["Server-Timing"] = f"{timing}, {total}" if timing else total
+    return response
+
+#3. Initialize Services
 resolver = DrugResolver()
 engine = InteractionEngine()
 summarizer = ClinicalSummarizer()
+jobs = JobManager(resolver, engine, summarizer)
+drug_search = DrugSearch()
 
 # HELPER: Context Fetcher
 def fetch_contexts(interactions):
-    drug_contexts = {}
-    involved_ids = set()
-    for i in interactions:
-        involved_ids.add(i.drug_a)
-        involved_ids.add(i.drug_b)
-        
-    for uid in involved_ids:
-        drug_contexts[uid] = summarizer.get_drug_context(uid)
-    return drug_contexts
+    with span("contexts"):
+        drug_contexts = {}
+        involved_ids = set()
+        for i in interactions:
+            involved_ids.add(i.drug_a)
+            involved_ids.add(i.drug_b)
+            
+        for uid in involved_ids:
+            drug_contexts[uid] = summarizer.get_drug_context(uid)
+        return drug_contexts
 
 # ENDPOINTS:
+# Responses are built internally from DB rows / sanitized LLM output, so they are
+# returned as ORJSONResponse directly; response_model stays for the OpenAPI schema.
+
+# Readiness: 503 until warm-up finishes, so the load balancer skips cold instances
+@app.get("/ready")
+async def get_readiness():
+    return ORJSONResponse(readiness, status_code=200 if readiness["ready"] else 503)
+
+# Prometheus scrape target
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# Query tracing: top-N statements by total time + recent per-request traces
+@app.get("/debug/queries")
+async def get_query_stats(limit: int = Query(10, ge=1, le=100), reset: bool = False):
+    if not db_manager.trace:
+        raise HTTPException(status_code=404, detail="Query tracing is disabled (DB_TRACE_QUERIES).")
+    stats = {
+        "slow_query_ms": db_manager.tracer.slow_query_ms,
+        "top_statements": db_manager.tracer.top(limit),
+        "recent_requests": db_manager.tracer.recent_requests()[-limit:]
+    }
+    if reset:
+        db_manager.tracer.reset()
+    return stats
+
+# In-memory cache sizes and hit rates
+@app.get("/debug/caches")
+async def get_cache_stats():
+    return {
+        "drug_contexts": summarizer._context_cache.stats(),
+        "bucketed_risk": summarizer._risk_cache.stats(),
+        "search_sessions": drug_search.stats(),
+        "speculative": summarizer.speculative.stats()
+    }
+
+# Ollama pool routing state (health, in-flight requests per backend)
+@app.get("/debug/ollama")
+async def get_ollama_status():
+    return {"backends": ollama_pool.status(), "queued_calls": llm_scheduler.queue_depth()}
 
 # 1. Search (Autocomplete)
 @app.get("/search", response_model=List[DrugSearchResult])
-async def search_drugs(q: str = Query(..., min_length=2)):
+async def search_drugs(
+    q: str = Query(..., min_length=2),
+    session: Optional[str] = Header(None, alias="X-Search-Session")
+):
     try:
-        search_term = q.strip()
-        results = set()
-        limit = 50
-        
-        # Search Mixtures (Brands)
-        res_mix = db_manager.query("SELECT name, drugbank_id FROM mixtures WHERE name LIKE ? LIMIT ?", (f"%{search_term}%", limit))
-        for r in res_mix: 
-            results.add((r['name'], r['drugbank_id'], "Brand"))
-            
-        # Search Generics
-        res_gen = db_manager.query("SELECT name, drugbank_id FROM general_info WHERE name LIKE ? LIMIT ?", (f"%{search_term}%", limit))
-        for r in res_gen: 
-            results.add((r['name'], r['drugbank_id'], "Generic"))
-            
-        # Search Synonyms
-        res_syn = db_manager.query("SELECT synonym, drugbank_id FROM synonyms WHERE synonym LIKE ? LIMIT ?", (f"%{search_term}%", limit))
-        for r in res_syn: 
-            results.add((r['synonym'], r['drugbank_id'], "Synonym"))
-        
-        # Format
-        final_results = []
-        for name, did, dtype in results:
-            final_results.append({"name": name, "id": did, "type": dtype})
-
-        # Sort: Starts With -> Length
-        def sort_key(item):
-            name_lower = item['name'].lower()
-            q_lower = search_term.lower()
-            starts_with = 0 if name_lower.startswith(q_lower) else 1
-            length = len(item['name'])
-            return (starts_with, length)
-
-        sorted_results = sorted(final_results, key=sort_key)
-        return sorted_results[:10]
-        
+        results = drug_search.search(q.strip(), session)
     except Exception as e:
         print(f"Search Error: {e}")
-        return []
+        return ORJSONResponse([], headers={"Cache-Control": "no-store"})
+
+    # Results depend only on q (the session just makes them cheaper), so browsers/proxies may reuse them
+    return ORJSONResponse(results, headers={"Cache-Control": f"public, max-age={SEARCH_CACHE_MAX_AGE_S}"})
 
 # 2. Interactions 
 @app.post("/analyze/interactions", response_model=InteractionResponse)
-async def get_interactions(request: MedsRequest):
+async def get_interactions(request: MedsRequest, background_tasks: BackgroundTasks):
     if len(request.medications) > 5:
         raise HTTPException(status_code=400, detail="Max 5 medications allowed.")
     
     # Call resolver
     resolved_map = resolver.resolve_input(request.medications)
-    unique_ids = list(set(resolved_map.values()))
+    # Sorted so each pair's direction (and so its description) doesn't depend on set order
+    unique_ids = sorted(set(resolved_map.values()))
     
     if len(unique_ids) < 2:
-        return InteractionResponse(
-            resolved_medications=resolved_map,
-            interactions_found=[]
-        )
+        return ORJSONResponse({
+            "resolved_medications": resolved_map,
+            "interactions_found": []
+        })
 
     interactions = engine.check_interactions(unique_ids)
+
+    # The report request follows right after; start its patient-independent LLM work now
+    if SPECULATIVE_PRECOMPUTE and interactions:
+        background_tasks.add_task(summarizer.speculate, interactions)
     
-    return InteractionResponse(
-        resolved_medications=resolved_map,
-        interactions_found=interactions
-    )
+    return ORJSONResponse({
+        "resolved_medications": resolved_map,
+        "interactions_found": interactions
+    })
 
 # 3. Food Warnings
 @app.post("/analyze/food", response_model=FoodResponse)
 async def get_food_warnings(request: IDRequest):
-    warnings = {}
-    for uid in request.drug_ids:
-        name_res = db_manager.query("SELECT name FROM general_info WHERE drugbank_id = ?", (uid,))
-        name = name_res[0]['name'] if name_res else uid
-        
-        food_res = db_manager.query("SELECT interaction FROM food_interactions WHERE drugbank_id = ?", (uid,))
-        if food_res:
-            warnings[name] = [r['interaction'] for r in food_res]
-            
-    return FoodResponse(food_warnings=warnings)
+    # One read of the materialized per-drug documents (normalized tables if not built)
+    return ORJSONResponse({"food_warnings": drug_documents.food_warnings(request.drug_ids)})
 
 # 4. References
 @app.post("/analyze/references", response_model=ReferenceResponse)
 async def get_references(request: IDRequest):
-    refs = {}
-    for uid in request.drug_ids:
-        name_res = db_manager.query("SELECT name FROM general_info WHERE drugbank_id = ?", (uid,))
-        name = name_res[0]['name'] if name_res else uid
-        
-        drug_refs = {"articles": [], "links": [], "attachments": [], "books": []}
-        
-        try:
-            # Articles
-            res_art = db_manager.query("SELECT citation, pubmed_id FROM ref_articles WHERE drugbank_id = ? LIMIT 5", (uid,))
-            drug_refs["articles"] = [f"{r['citation']} (PMID: {r['pubmed_id']})" if r['pubmed_id'] else r['citation'] for r in res_art]
-            
-            # Attachments
-            res_att = db_manager.query("SELECT title, url FROM ref_attachments WHERE drugbank_id = ? LIMIT 5", (uid,))
-            drug_refs["attachments"] = [f"{r['title']}: {r['url']}" for r in res_att]
-
-            # Books
-            res_book = db_manager.query("SELECT citation, isbn FROM ref_books WHERE drugbank_id = ? LIMIT 5", (uid,))
-            drug_refs["books"] = [f"{r['citation']} (ISBN: {r['isbn']})" if r['isbn'] else r['citation'] for r in res_book]
-
-            # Links
-            res_link = db_manager.query("SELECT title, url FROM ref_links WHERE drugbank_id = ? LIMIT 5", (uid,))
-            drug_refs["links"] = [f"{r['title']}: {r['url']}" for r in res_link]
+    return ORJSONResponse({"references": drug_documents.references(request.drug_ids)})
 
-        except Exception as e:
-            print(f"Reference Fetch Error for {uid}: {e}")
-            
-        refs[name] = drug_refs
-        
-    return ReferenceResponse(references=refs)
+# LLM endpoints are plain `def`: FastAPI runs them in its threadpool, so a slow
+# report doesn't block the event loop and calls queue in the LLM scheduler instead.
 
 # 5. Severity Classification
 @app.post("/analyze/severity", response_model=SeverityResponse)
-async def classify_severity(request: AnalysisRequest): 
+def classify_severity(request: AnalysisRequest): 
     interactions_list = [i.model_dump() for i in request.interactions]
-    results = summarizer.classify_severity_batch(interactions_list)
-    return SeverityResponse(results=results) 
+    with request_deadline(ANALYSIS_DEADLINE_S):
+        results = summarizer.classify_severity_batch(interactions_list)
+    return ORJSONResponse({"results": results}) 
 
 # 6. Mechanism Explanation
 @app.post("/analyze/mechanism", response_model=MechanismResponse)
-async def explain_mechanism(request: AnalysisRequest):
-    drug_contexts = fetch_contexts(request.interactions)
+def explain_mechanism(request: AnalysisRequest):
     interactions_list = [i.model_dump() for i in request.interactions]
-    results = summarizer.generate_interaction_summary_batch(interactions_list)
+    with request_deadline(ANALYSIS_DEADLINE_S):
+        results = summarizer.generate_interaction_summary_batch(interactions_list)
     
     final_results = []
     for r in results:
         final_results.append({
             "drug_a": r['drug_a'], 
             "drug_b": r['drug_b'], 
-            "interaction_summary": r['interaction_summary'] 
+            "interaction_summary": r['interaction_summary'],
+            "degraded": r['degraded']
         })
-    return MechanismResponse(results=final_results)
+    return ORJSONResponse({"results": final_results})
 
 # 7. Clinical Recommendation
 @app.post("/analyze/recommendation", response_model=RecommendationResponse)
-async def give_recommendation(request: AnalysisRequest):
+def give_recommendation(request: AnalysisRequest):
     drug_contexts = fetch_contexts(request.interactions)
     interactions_list = [i.model_dump() for i in request.interactions]
-    results = summarizer.generate_recommendation_batch(interactions_list, drug_contexts)
-    return RecommendationResponse(results=results) 
+    with request_deadline(ANALYSIS_DEADLINE_S):
+        results = summarizer.generate_recommendation_batch(interactions_list, drug_contexts)
+    return ORJSONResponse({"results": results}) 
 
 # 8. Patient Risk Assessment
 @app.post("/analyze/risk", response_model=RiskResponse)
-async def assess_risk(request: AnalysisRequest):
+def assess_risk(request: AnalysisRequest):
     drug_contexts = fetch_contexts(request.interactions)
     interactions_list = [i.model_dump() for i in request.interactions]
     
-    results = summarizer.generate_risk_batch(
-        interactions_list, 
-        drug_contexts, 
-        request.patient.model_dump()
-    )
-    return RiskResponse(results=results) 
+    with request_deadline(ANALYSIS_DEADLINE_S):
+        results = summarizer.generate_risk_batch(
+            interactions_list, 
+            drug_contexts, 
+            request.patient.model_dump(),
+            request.bucketed_risk
+        )
+    return ORJSONResponse({"results": results}) 
 
 #  Full Report
 @app.post("/analyze/report", response_model=ReportResponse)
-async def get_ai_report(request: ReportRequest):
+def get_ai_report(request: ReportRequest):
     drug_contexts = fetch_contexts(request.interactions)
     interactions_list = [i.model_dump() for i in request.interactions]
 
-    # Get Structured Cards
-    cards = summarizer.generate_structured_analysis(
-        interactions_list,
-        drug_contexts,
-        request.patient.model_dump()
-    )
-    
-    severity_map = summarizer.classify_severity_batch(interactions_list)
+    with request_deadline(ANALYSIS_DEADLINE_S):
+        # Severity first: it has the interactive priority and is what the UI shows first
+        severity_map = summarizer.classify_severity_batch(interactions_list)
+
+        # Get Structured Cards
+        cards = summarizer.generate_structured_analysis(
+            interactions_list,
+            drug_contexts,
+            request.patient.model_dump(),
+            request.bucketed_risk
+        )
     
     for i, card in enumerate(cards):
         if i < len(severity_map):
             card['severity'] = severity_map[i]['severity']
+            card['degraded'] = card['degraded'] or severity_map[i]['degraded']
 
-    return ReportResponse(
-        clinical_analysis="See cards below", 
-        analysis_cards=cards 
-    )
+    return ORJSONResponse({
+        "clinical_analysis": "See cards below", 
+        "analysis_cards": cards 
+    })
+
+# Bulk Medication Review Jobs
+# Body: NDJSON (application/x-ndjson) or CSV (text/csv), one patient per row
+@app.post("/jobs/medication-review", status_code=202)
+async def create_review_job(request: Request, bucketed_risk: bool = True):
+    body = await request.body()
+    try:
+        rows = parse_rows(body, request.headers.get("content-type", ""))
+    except (JobInputError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not rows:
+        raise HTTPException(status_code=400, detail="No rows in upload.")
 
+    job = jobs.submit(rows, bucketed_risk)
+    return job.status_dict()
+
+@app.get("/jobs/{job_id}")
+async def get_review_job(job_id: str):
+    job = jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job.status_dict()
+
+# Results are written chunk by chunk, so a running job returns the complete chunks done so far
+@app.get("/jobs/{job_id}/results")
+async def download_review_results(job_id: str):
+    job = jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    if job.status == "queued":
+        raise HTTPException(status_code=409, detail="Job has not started yet.")
+    return StreamingResponse(
+        job.read_results(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="medication-review-{job.id}.ndjson"'}
+    )
 
 
 '''
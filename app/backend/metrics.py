@@ -0,0 +1,159 @@
+import time
+import threading
+import contextvars
+import functools
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+# Latency buckets (seconds): covers fast SQL lookups up to multi-minute LLM reports
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# Token buckets: prompt/response sizes reported by Ollama's eval stats
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+# Spans recorded during the current request (None outside of a request)
+_request_spans: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    "request_spans", default=None
+)
+
+
+class Histogram:
+    """Cumulative Prometheus-style histogram with a fixed label set."""
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...], buckets: Tuple[float, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series: Dict[Tuple[str, ...], List] = {}  # label values -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = [[0] * len(self.buckets), 0.0, 0]
+                self._series[label_values] = series
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(k, list(v[0]), v[1], v[2]) for k, v in self._series.items()]
+
+        for label_values, counts, total, count in sorted(snapshot):
+            base = ",".join(f'{k}="{v}"' for k, v in zip(self.labels, label_values))
+            sep = "," if base else ""
+            for bound, c in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{bound:g}"}} {c}')
+            lines.append(f'{self.name}_bucket{{{base}{sep}le="+Inf"}} {count}')
+            suffix = f"{{{base}}}" if base else ""
+            lines.append(f"{self.name}_sum{suffix} {total:.6f}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds all histograms and renders them in the Prometheus text format."""
+    def __init__(self):
+        self.stage_seconds = Histogram(
+            "mic_stage_duration_seconds", "Wall time spent in each pipeline stage.",
+            ("stage",), LATENCY_BUCKETS
+        )
+        self.llm_seconds = Histogram(
+            "mic_llm_call_duration_seconds", "Wall time of individual Ollama calls.",
+            ("task",), LATENCY_BUCKETS
+        )
+        self.llm_tokens = Histogram(
+            "mic_llm_tokens", "Prompt/response token counts from Ollama eval stats.",
+            ("task", "kind"), TOKEN_BUCKETS
+        )
+        self.llm_queue_seconds = Histogram(
+            "mic_llm_queue_wait_seconds", "Time LLM calls spent queued, by outcome (run/shed/expired).",
+            ("priority", "outcome"), LATENCY_BUCKETS
+        )
+        self.request_seconds = Histogram(
+            "mic_http_request_duration_seconds", "End-to-end HTTP request latency.",
+            ("method", "route", "status"), LATENCY_BUCKETS
+        )
+
+    def render(self) -> str:
+        lines = []
+        for hist in (self.stage_seconds, self.llm_seconds, self.llm_tokens, self.llm_queue_seconds, self.request_seconds):
+            lines.extend(hist.render())
+        return "\n".join(lines) + "\n"
+
+
+# Global instance to be imported by services
+metrics = MetricsRegistry()
+
+
+def _record_span(name: str, elapsed: float):
+    spans = _request_spans.get()
+    if spans is not None:
+        spans.append((name, elapsed))
+
+
+@contextmanager
+def span(stage: str):
+    """Times a pipeline stage into the stage histogram and the request's Server-Timing."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.stage_seconds.observe(elapsed, stage)
+        _record_span(stage, elapsed)
+
+
+def timed(stage: str):
+    """Decorator form of span() for whole service methods."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_llm_call(task: str, elapsed: float, prompt_tokens: Optional[int] = None, completion_tokens: Optional[int] = None):
+    metrics.llm_seconds.observe(elapsed, task)
+    if prompt_tokens is not None:
+        metrics.llm_tokens.observe(prompt_tokens, task, "prompt")
+    if completion_tokens is not None:
+        metrics.llm_tokens.observe(completion_tokens, task, "completion")
+    _record_span(f"llm.{task}", elapsed)
+
+
+def record_db_query(elapsed: float):
+    # Shows up in Server-Timing as a single "db" entry with the statement count
+    _record_span("db", elapsed)
+
+
+def start_request():
+    """Begins span collection for a request; returns a token for end_request()."""
+    return _request_spans.set([])
+
+
+def end_request(token) -> str:
+    """Stops span collection and returns the Server-Timing header value."""
+    spans = _request_spans.get() or []
+    _request_spans.reset(token)
+
+    # Aggregate repeated spans (e.g. several LLM calls for the same task)
+    totals: Dict[str, List] = {}
+    for name, elapsed in spans:
+        entry = totals.setdefault(name, [0.0, 0])
+        entry[0] += elapsed
+        entry[1] += 1
+
+    parts = []
+    for name, (elapsed, count) in totals.items():
+        part = f"{name};dur={elapsed * 1000:.1f}"
+        if count > 1:
+            part += f';desc="{count} calls"'
+        parts.append(part)
+    return ", ".join(parts)
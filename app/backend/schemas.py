@@ -32,6 +32,7 @@ class AnalysisRequest(BaseModel):
     interactions: List[InteractionItem] 
     patient: PatientProfile
     drug_ids: Optional[List[str]] = None
+    bucketed_risk: bool = False  # Opt-in: assess risk per patient bucket (cacheable) instead of exact profile
 
 # Explicit definition to ensure importability
 class ReportRequest(AnalysisRequest):
@@ -56,6 +57,7 @@ class SeverityResult(BaseModel):
     drug_b: str
     severity: str 
     short_reason: str
+    degraded: bool = False  # True when a fallback was returned (LLM shed, timed out or failed)
 
 class SeverityResponse(BaseModel):
     results: List[SeverityResult]
@@ -64,6 +66,7 @@ class MechanismResult(BaseModel):
     drug_a: str
     drug_b: str
     interaction_summary: str
+    degraded: bool = False  # True when a fallback was returned (LLM shed, timed out or failed)
 
 class MechanismResponse(BaseModel):
     results: List[MechanismResult]
@@ -72,6 +75,7 @@ class RecommendationResult(BaseModel):
     drug_a: str
     drug_b: str
     recommendation: str
+    degraded: bool = False  # True when a fallback was returned (LLM shed, timed out or failed)
 
 class RecommendationResponse(BaseModel):
     results: List[RecommendationResult]
@@ -80,6 +84,8 @@ class RiskResult(BaseModel):
     drug_a: str
     drug_b: str
     patient_risk: str
+    bucketed: bool = False  # True when assessed for the patient's bucket, not exact values
+    degraded: bool = False
 
 class RiskResponse(BaseModel):
     results: List[RiskResult]
@@ -91,6 +97,8 @@ class ClinicalAnalysisItem(BaseModel):
     interaction_summary: str
     recommendation: str
     patient_risk: str
+    bucketed: bool = False
+    degraded: bool = False
 
 class ReportResponse(BaseModel):
     clinical_analysis: str 
@@ -0,0 +1,58 @@
+import re
+import json
+from typing import Dict
+
+# DrugBank inline citation markers, e.g. [A12345], [L6718, F4567]
+_CITATION = re.compile(r"\s*\[(?:[A-Z]\d+(?:\s*,\s*)?)+\]")
+_WHITESPACE = re.compile(r"\s+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English text with Llama tokenizers
+    return len(text) // 4 + 1
+
+def condense_text(text: str, max_tokens: int) -> str:
+    """
+    Shrinks a DrugBank free-text field to a token budget.
+    Drops citation markers, then keeps whole leading sentences; a single
+    over-long sentence is cut at a word boundary.
+    """
+    if not text:
+        return text
+    text = _WHITESPACE.sub(" ", _CITATION.sub("", str(text))).strip()
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    max_chars = max_tokens * 4
+    kept = ""
+    for sentence in _SENTENCE_END.split(text):
+        candidate = f"{kept} {sentence}".strip()
+        if len(candidate) > max_chars:
+            break
+        kept = candidate
+    if kept:
+        return kept
+    return text[:max_chars].rsplit(" ", 1)[0] + "..."
+
+def fit_fields(fields: Dict[str, Dict[str, str]], max_tokens: int) -> Dict[str, Dict[str, str]]:
+    """
+    Trims a {drug: {field: text}} context so its text fits max_tokens,
+    repeatedly halving the longest field; fields already down to a few
+    tokens are emptied, so only the keys can remain over budget.
+    """
+    fields = {drug: dict(values) for drug, values in fields.items()}
+
+    def total():
+        # Measured as serialized, since that is how it lands in the prompt
+        return estimate_tokens(json.dumps(fields))
+
+    while total() > max_tokens:
+        drug, key = max(
+            ((d, k) for d, values in fields.items() for k in values),
+            key=lambda dk: len(fields[dk[0]][dk[1]])
+        )
+        if not fields[drug][key]:
+            break  # Every field is empty; only the keys are left
+        current = estimate_tokens(fields[drug][key])
+        fields[drug][key] = condense_text(fields[drug][key], current // 2) if current > 8 else ""
+    return fields
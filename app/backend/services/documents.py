@@ -0,0 +1,111 @@
+import zlib
+import orjson
+from typing import List, Dict, Optional
+from ..database import db_manager
+from ..config import REFERENCES_PER_TYPE, DOCUMENT_ZLIB_LEVEL
+
+
+# Reference formatting, shared by SQL_Builder (materialized documents) and the table fallback
+def format_article(r) -> str:
+    return f"{r['citation']} (PMID: {r['pubmed_id']})" if r['pubmed_id'] else r['citation']
+
+def format_book(r) -> str:
+    return f"{r['citation']} (ISBN: {r['isbn']})" if r['isbn'] else r['citation']
+
+def format_titled_url(r) -> str:
+    return f"{r['title']}: {r['url']}"
+
+# Response key -> (table, columns, formatter)
+REFERENCE_SOURCES = {
+    "articles": ("ref_articles", "citation, pubmed_id", format_article),
+    "links": ("ref_links", "title, url", format_titled_url),
+    "attachments": ("ref_attachments", "title, url", format_titled_url),
+    "books": ("ref_books", "citation, isbn", format_book),
+}
+
+
+def encode_document(doc: Dict) -> bytes:
+    return zlib.compress(orjson.dumps(doc), DOCUMENT_ZLIB_LEVEL)
+
+
+def decode_document(blob: bytes) -> Dict:
+    return orjson.loads(zlib.decompress(blob))
+
+
+class DrugDocuments:
+    """
+    Per-drug documents (name, food warnings, top references per type, condensed
+    context) materialized by SQL_Builder into `drug_documents`.
+    Databases built without that table fall back to the normalized tables.
+    """
+    def __init__(self):
+        self.db = db_manager
+        self._available = None
+
+    def available(self) -> bool:
+        if self._available is None:
+            res = self.db.query("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'drug_documents'")
+            self._available = bool(res)
+        return self._available
+
+    def get_many(self, drug_ids: List[str]) -> Dict[str, Dict]:
+        """One indexed read for all ids; ids without a document are left out."""
+        if not drug_ids or not self.available():
+            return {}
+        placeholders = ",".join("?" * len(drug_ids))
+        res = self.db.query(
+            f"SELECT drugbank_id, doc FROM drug_documents WHERE drugbank_id IN ({placeholders})",
+            tuple(drug_ids)
+        )
+        return {r['drugbank_id']: decode_document(r['doc']) for r in res}
+
+    def get(self, drug_id: str) -> Optional[Dict]:
+        return self.get_many([drug_id]).get(drug_id)
+
+    def food_warnings(self, drug_ids: List[str]) -> Dict[str, List[str]]:
+        docs = self.get_many(drug_ids)
+        warnings = {}
+        for uid in drug_ids:
+            doc = docs.get(uid)
+            if doc:
+                name, food = doc['name'] or uid, doc['food']
+            else:
+                name, food = self._name(uid), self._food_from_tables(uid)
+            if food:
+                warnings[name] = food
+        return warnings
+
+    def references(self, drug_ids: List[str]) -> Dict[str, Dict[str, List[str]]]:
+        docs = self.get_many(drug_ids)
+        refs = {}
+        for uid in drug_ids:
+            doc = docs.get(uid)
+            if doc:
+                refs[doc['name'] or uid] = doc['references']
+            else:
+                refs[self._name(uid)] = self._references_from_tables(uid)
+        return refs
+
+    # Normalized-table path (databases without drug_documents, or drugs missing from it)
+    def _name(self, uid: str) -> str:
+        name_res = self.db.query("SELECT name FROM general_info WHERE drugbank_id = ?", (uid,))
+        return name_res[0]['name'] if name_res else uid
+
+    def _food_from_tables(self, uid: str) -> List[str]:
+        food_res = self.db.query("SELECT interaction FROM food_interactions WHERE drugbank_id = ?", (uid,))
+        return [r['interaction'] for r in food_res]
+
+    def _references_from_tables(self, uid: str) -> Dict[str, List[str]]:
+        drug_refs = {key: [] for key in REFERENCE_SOURCES}
+        try:
+            for key, (table, columns, formatter) in REFERENCE_SOURCES.items():
+                res = self.db.query(
+                    f"SELECT {columns} FROM {table} WHERE drugbank_id = ? LIMIT ?", (uid, REFERENCES_PER_TYPE)
+                )
+                drug_refs[key] = [formatter(r) for r in res]
+        except Exception as e:
+            print(f"Reference Fetch Error for {uid}: {e}")
+        return drug_refs
+
+# Global instance to be imported by services
+drug_documents = DrugDocuments()
@@ -1,6 +1,7 @@
 import itertools
-from typing import List, Dict
+from typing import List, Dict, Tuple, Iterable
 from ..database import db_manager
+from ..metrics import span
 
 class InteractionEngine:
     """Checks Database for Pairs"""
@@ -9,6 +10,10 @@ class InteractionEngine:
         self.db = db_manager
 
     def check_interactions(self, drug_ids: List[str]) -> List[Dict]:
+        with span("interactions"):
+            return self._check_pairs(drug_ids)
+
+    def _check_pairs(self, drug_ids: List[str]) -> List[Dict]:
         interactions_found = []
         # Generate unique pairs only once (A, B)
         pairs = list(itertools.combinations(drug_ids, 2))
@@ -19,10 +24,11 @@ class InteractionEngine:
                 SELECT * FROM drug_interactions 
                 WHERE (drugbank_id = ? AND target_drugbank_id = ?)
                 OR (drugbank_id = ? AND target_drugbank_id = ?)
+                ORDER BY drugbank_id = ? DESC, rowid
             """
-            results = self.db.query(sql, (id_a, id_b, id_b, id_a))
+            results = self.db.query(sql, (id_a, id_b, id_b, id_a, id_a))
             
-            # If results exist, just take the first one.
+            # If results exist, just take the first one (the A->B row if the pair is stored both ways)
             if results:
                 row = results[0] 
                 interactions_found.append({
@@ -31,4 +37,37 @@ class InteractionEngine:
                     "description": row['description']
                 })
                 
-        return interactions_found
\ No newline at end of file
+        return interactions_found
+
+    def check_pairs_batch(self, pairs: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], Dict]:
+        """
+        Looks up many pairs in one query (bulk jobs).
+        Keys are (min_id, max_id); pairs without an interaction are absent.
+        Direction follows check_interactions on sorted ids: the min->max row wins, else max->min.
+        """
+        with span("interactions.batch"):
+            wanted = {(min(a, b), max(a, b)) for a, b in pairs if a != b}
+            ids = sorted({i for pair in wanted for i in pair})
+            if not ids:
+                return {}
+
+            placeholders = ",".join("?" * len(ids))
+            sql = f"""
+                SELECT drugbank_id, target_drugbank_id, description FROM drug_interactions
+                WHERE drugbank_id IN ({placeholders}) AND target_drugbank_id IN ({placeholders})
+                ORDER BY rowid
+            """
+            found = {}
+            for row in self.db.query(sql, tuple(ids) * 2):
+                key = (min(row['drugbank_id'], row['target_drugbank_id']), max(row['drugbank_id'], row['target_drugbank_id']))
+                if key not in wanted:
+                    continue
+                forward = row['drugbank_id'] == key[0]
+                # First row per direction (rowid order); a forward row replaces a reverse one
+                if key not in found or (forward and found[key]['drug_a'] != key[0]):
+                    found[key] = {
+                        "drug_a": row['drugbank_id'],
+                        "drug_b": row['target_drugbank_id'],
+                        "description": row['description']
+                    }
+            return found
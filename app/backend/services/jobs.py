@@ -0,0 +1,294 @@
+import csv
+import io
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Tuple
+from pydantic import ValidationError
+from ..config import (
+    JOBS_DIR, JOB_WORKERS, JOB_CHUNK_SIZE, JOB_MAX_ROWS, JOB_MAX_MEDICATIONS, JOB_RETENTION_S, JOB_MAX_RETAINED
+)
+from ..schemas import PatientProfile
+from .resolver import DrugResolver
+from .interaction import InteractionEngine
+from .summarizer import ClinicalSummarizer
+from .scheduler import llm_priority
+
+
+class JobInputError(ValueError):
+    """The upload as a whole can't be parsed (bad format, too many rows)."""
+
+
+def _split_list(value: str) -> List[str]:
+    return [v.strip() for v in (value or "").split(";") if v.strip()]
+
+
+def parse_rows(body: bytes, content_type: str) -> List[Dict]:
+    """
+    Parses an NDJSON or CSV upload into raw rows.
+    NDJSON: {"patient_id": ..., "patient": {...}, "medications": [...]} per line.
+    CSV: patient_id, age, gender, weight, height, conditions, medications
+         (conditions/medications are ';'-separated).
+    """
+    text = body.decode("utf-8-sig")
+    if "csv" in content_type:
+        rows = []
+        for rec in csv.DictReader(io.StringIO(text)):
+            rows.append({
+                "patient_id": rec.get("patient_id"),
+                "patient": {
+                    "age": rec.get("age"),
+                    "gender": rec.get("gender"),
+                    "weight": rec.get("weight") or None,
+                    "height": rec.get("height") or None,
+                    "conditions": _split_list(rec.get("conditions")),
+                },
+                "medications": _split_list(rec.get("medications")),
+            })
+    else:
+        rows = []
+        for line_no, line in enumerate(text.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                rows.append({"_error": f"line {line_no}: invalid JSON ({e.msg})"})
+
+    if len(rows) > JOB_MAX_ROWS:
+        raise JobInputError(f"Max {JOB_MAX_ROWS} rows per job.")
+    return rows
+
+
+def validate_row(raw: Dict) -> Tuple[Optional[Dict], Optional[str]]:
+    """Returns (row, None) or (None, error message)."""
+    if not isinstance(raw, dict):
+        return None, "row must be a JSON object"
+    if "_error" in raw:
+        return None, raw["_error"]
+    try:
+        patient = PatientProfile.model_validate(raw.get("patient") or {}).model_dump()
+    except ValidationError as e:
+        return None, f"invalid patient: {e.errors()[0]['msg']}"
+    meds = raw.get("medications") or []
+    if not isinstance(meds, list) or not all(isinstance(m, str) for m in meds):
+        return None, "medications must be a list of names"
+    if len(meds) > JOB_MAX_MEDICATIONS:
+        return None, f"max {JOB_MAX_MEDICATIONS} medications per row"
+    return {"patient_id": raw.get("patient_id"), "patient": patient, "medications": meds}, None
+
+
+class MedicationReviewJob:
+    def __init__(self, rows: List[Dict], bucketed_risk: bool):
+        self.id = uuid.uuid4().hex
+        self.rows = rows
+        self.total_rows = len(rows)
+        self.bucketed_risk = bucketed_risk
+        self.status = "queued"
+        self.processed = 0
+        self.failed_rows = 0
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.output_path = os.path.join(JOBS_DIR, f"{self.id}.ndjson")
+        self.bytes_written = 0  # End of the last complete chunk; readers never go past it
+        # Patient-independent LLM results shared by every row of the job, keyed by (min_id, max_id)
+        self.pair_results: Dict[Tuple[str, str], Dict] = {}
+        self.unique_pairs = 0
+
+    def release(self):
+        """Frees the input rows and shared LLM results once the job has finished."""
+        self.unique_pairs = len(self.pair_results)
+        self.rows = []
+        self.pair_results = {}
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def read_results(self, block_size: int = 64 * 1024):
+        """Yields the output file up to the last flushed chunk (safe while the job is still writing)."""
+        remaining = self.bytes_written
+        with open(self.output_path, "rb") as f:
+            while remaining > 0:
+                block = f.read(min(block_size, remaining))
+                if not block:
+                    break
+                remaining -= len(block)
+                yield block
+
+    def status_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "total_rows": self.total_rows,
+            "processed_rows": self.processed,
+            "failed_rows": self.failed_rows,
+            "progress": round(self.processed / self.total_rows, 4) if self.total_rows else 1.0,
+            "unique_pairs_analyzed": self.unique_pairs,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    """
+    Runs bulk medication reviews in a background worker pool.
+    Each chunk of rows is resolved and interaction-checked with batched queries,
+    and LLM work is shared: severity/summary/recommendation once per unique pair
+    per job, patient risk once per (pair, patient bucket).
+    """
+    def __init__(self, resolver: DrugResolver, engine: InteractionEngine, summarizer: ClinicalSummarizer,
+                 workers: int = JOB_WORKERS):
+        self.resolver = resolver
+        self.engine = engine
+        self.summarizer = summarizer
+        self.jobs: Dict[str, MedicationReviewJob] = {}
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="review-job")
+        self._lock = threading.Lock()
+
+    def submit(self, rows: List[Dict], bucketed_risk: bool = True) -> MedicationReviewJob:
+        os.makedirs(JOBS_DIR, exist_ok=True)
+        self.prune()
+        job = MedicationReviewJob(rows, bucketed_risk)
+        with self._lock:
+            self.jobs[job.id] = job
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[MedicationReviewJob]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def prune(self):
+        """
+        Forgets finished jobs older than JOB_RETENTION_S or beyond the newest
+        JOB_MAX_RETAINED, deleting their result files (and stale files from earlier runs).
+        """
+        now = time.time()
+        with self._lock:
+            finished = sorted((j for j in self.jobs.values() if j.finished), key=lambda j: j.finished_at, reverse=True)
+            expired = [
+                j for i, j in enumerate(finished)
+                if i >= JOB_MAX_RETAINED or now - j.finished_at > JOB_RETENTION_S
+            ]
+            for job in expired:
+                del self.jobs[job.id]
+            known = {os.path.basename(j.output_path) for j in self.jobs.values()}
+
+        for job in expired:
+            self._remove_file(job.output_path)
+        for name in os.listdir(JOBS_DIR):
+            path = os.path.join(JOBS_DIR, name)
+            if name not in known and now - os.path.getmtime(path) > JOB_RETENTION_S:
+                self._remove_file(path)
+
+    def _remove_file(self, path: str):
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(f"Job Cleanup Error ({path}): {e}")
+
+    def _run(self, job: MedicationReviewJob):
+        try:
+            # Bulk work never competes with interactive requests for the LLM
+            with llm_priority("bulk"), open(job.output_path, "wb") as out:
+                # The file exists before the job is reported as running
+                job.status = "running"
+                for start in range(0, len(job.rows), JOB_CHUNK_SIZE):
+                    chunk = list(enumerate(job.rows[start:start + JOB_CHUNK_SIZE], start=start))
+                    lines = "".join(json.dumps(record) + "\n" for record in self._process_chunk(job, chunk))
+                    out.write(lines.encode("utf-8"))
+                    out.flush()
+                    job.bytes_written = out.tell()
+                    job.processed += len(chunk)
+            job.status = "done"
+        except Exception as e:
+            print(f"Job Error ({job.id}): {e}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            job.release()
+
+    def _process_chunk(self, job: MedicationReviewJob, chunk: List[Tuple[int, Dict]]) -> List[Dict]:
+        rows, records = [], {}
+        for idx, raw in chunk:
+            row, error = validate_row(raw)
+            if error:
+                patient_id = raw.get("patient_id") if isinstance(raw, dict) else None
+                records[idx] = {"row": idx, "patient_id": patient_id, "error": error}
+                job.failed_rows += 1
+            else:
+                rows.append((idx, row))
+
+        # 1. One resolution pass for every medication name in the chunk
+        resolved = self.resolver.resolve_batch([m for _, row in rows for m in row['medications']])
+        row_ids = {}
+        for idx, row in rows:
+            mapping = {}
+            for med in row['medications']:
+                mapping.update(resolved.get(med, {}))
+            row_ids[idx] = mapping
+
+        # 2. One interaction query for every pair in the chunk
+        row_pairs = {
+            idx: [(min(a, b), max(a, b)) for a, b in itertools.combinations(sorted(set(mapping.values())), 2)]
+            for idx, mapping in row_ids.items()
+        }
+        found = self.engine.check_pairs_batch({p for pairs in row_pairs.values() for p in pairs})
+
+        # 3. Contexts and patient-independent LLM work, once per new pair
+        contexts = {uid: self.summarizer.get_drug_context(uid) for pair in found for uid in pair}
+        pair_results = {p: job.pair_results[p] for p in found if p in job.pair_results}
+        new_pairs = [p for p in found if p not in pair_results]
+        if new_pairs:
+            inters = [found[p] for p in new_pairs]
+            severities = self.summarizer.classify_severity_batch(inters)
+            summaries = self.summarizer.generate_interaction_summary_batch(inters)
+            recomms = self.summarizer.generate_recommendation_batch(inters, contexts)
+            for p, sev, summ, rec in zip(new_pairs, severities, summaries, recomms):
+                pair_results[p] = {
+                    "severity": sev['severity'],
+                    "interaction_summary": summ['interaction_summary'],
+                    "recommendation": rec['recommendation'],
+                    "degraded": sev['degraded'] or summ['degraded'] or rec['degraded']
+                }
+                # Fallback text is only used for this chunk; the next chunk retries the pair
+                if not pair_results[p]['degraded']:
+                    job.pair_results[p] = pair_results[p]
+
+        # 4. Patient risk: bucketed mode shares results across patients in the same bucket
+        for idx, row in rows:
+            inters = [found[p] for p in row_pairs[idx] if p in found]
+            risks = self.summarizer.generate_risk_batch(inters, contexts, row['patient'], job.bucketed_risk) if inters else []
+            cards = []
+            for inter, risk in zip(inters, risks):
+                pair = (min(inter['drug_a'], inter['drug_b']), max(inter['drug_a'], inter['drug_b']))
+                shared = pair_results[pair]
+                cards.append({
+                    "drug_a": contexts.get(inter['drug_a'], {}).get('name', inter['drug_a']),
+                    "drug_b": contexts.get(inter['drug_b'], {}).get('name', inter['drug_b']),
+                    "severity": shared['severity'],
+                    "interaction_summary": shared['interaction_summary'],
+                    "recommendation": shared['recommendation'],
+                    "patient_risk": risk['patient_risk'],
+                    "bucketed": risk['bucketed'],
+                    "degraded": shared['degraded'] or risk['degraded']
+                })
+
+            mapping = row_ids[idx]
+            records[idx] = {
+                "row": idx,
+                "patient_id": row['patient_id'],
+                "resolved_medications": mapping,
+                "unresolved_medications": [m for m in row['medications'] if not resolved.get(m)],
+                "analysis_cards": cards
+            }
+
+        return [records[idx] for idx, _ in chunk]
@@ -0,0 +1,182 @@
+import threading
+import time
+import requests
+from typing import List, Dict, Optional
+from ..config import (
+    OLLAMA_URLS, OLLAMA_MAX_CONCURRENCY, OLLAMA_TIMEOUT_S,
+    OLLAMA_HEALTH_INTERVAL_S, OLLAMA_FAILURE_THRESHOLD
+)
+
+
+class NoBackendAvailable(Exception):
+    """Raised when every backend is ejected or busy past the wait timeout."""
+
+
+class OllamaBackend:
+    """One Ollama server and its routing state."""
+    def __init__(self, url: str, max_concurrency: int):
+        self.url = url
+        # Health checks hit the server root API, e.g. http://host:11434/api/tags
+        self.base_url = url.split("/api/")[0]
+        self.max_concurrency = max_concurrency
+        self.outstanding = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.total_requests = 0
+        self.total_failures = 0
+
+    def has_capacity(self) -> bool:
+        return self.healthy and self.outstanding < self.max_concurrency
+
+    def status(self) -> Dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "max_concurrency": self.max_concurrency,
+            "consecutive_failures": self.consecutive_failures,
+            "total_requests": self.total_requests,
+            "total_failures": self.total_failures
+        }
+
+
+class OllamaPool:
+    """
+    Routes generate calls across several Ollama servers.
+    Least-outstanding-requests selection, per-backend concurrency limits,
+    ejection after repeated failures and re-admission by background health checks.
+    """
+    def __init__(self, urls: List[str] = OLLAMA_URLS, max_concurrency: int = OLLAMA_MAX_CONCURRENCY,
+                 timeout: float = OLLAMA_TIMEOUT_S, health_interval: float = OLLAMA_HEALTH_INTERVAL_S,
+                 failure_threshold: int = OLLAMA_FAILURE_THRESHOLD):
+        self.backends = [OllamaBackend(u, max_concurrency) for u in urls]
+        self.timeout = timeout
+        self.health_interval = health_interval
+        self.failure_threshold = failure_threshold
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._health_thread = None
+
+    # Routing
+    def acquire(self, wait: Optional[float] = None, exclude: tuple = ()) -> OllamaBackend:
+        wait = self.timeout if wait is None else wait
+        deadline = time.monotonic() + wait
+        with self._cond:
+            while True:
+                if not any(b.healthy and b not in exclude for b in self.backends):
+                    raise NoBackendAvailable("All Ollama backends are ejected.")
+                candidates = [b for b in self.backends if b.has_capacity() and b not in exclude]
+                if candidates:
+                    backend = min(candidates, key=lambda b: b.outstanding)
+                    backend.outstanding += 1
+                    backend.total_requests += 1
+                    return backend
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise NoBackendAvailable("Timed out waiting for a free Ollama backend.")
+                self._cond.wait(remaining)
+
+    def release(self, backend: OllamaBackend, ok: bool):
+        with self._cond:
+            backend.outstanding -= 1
+            if ok:
+                backend.consecutive_failures = 0
+            else:
+                backend.total_failures += 1
+                backend.consecutive_failures += 1
+                if backend.healthy and backend.consecutive_failures >= self.failure_threshold:
+                    backend.healthy = False
+                    print(f"Ollama backend ejected: {backend.url}")
+            self._cond.notify_all()
+
+    def generate(self, payload: Dict, timeout: Optional[float] = None) -> Dict:
+        """
+        POSTs to the least-loaded backend; retries once on another backend if it fails.
+        timeout is the budget for the whole call: waiting for a backend, the request and any retry.
+        """
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        last_error = None
+        tried = []
+        for _ in range(min(2, len(self.backends))):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break  # No budget left for a retry
+            try:
+                backend = self.acquire(wait=remaining, exclude=tuple(tried))
+            except NoBackendAvailable:
+                if last_error:
+                    break
+                raise
+            tried.append(backend)
+            ok = False
+            try:
+                resp = requests.post(backend.url, json=payload, timeout=max(deadline - time.monotonic(), 0.1))
+                if resp.status_code == 200:
+                    ok = True
+                    return resp.json()
+                last_error = RuntimeError(f"{backend.url} returned HTTP {resp.status_code}")
+                # 4xx is a bad request, not a bad backend: no point retrying elsewhere
+                if resp.status_code < 500:
+                    ok = True
+                    break
+            except requests.ReadTimeout as e:
+                # The caller's budget ran out, not the backend: a slow but healthy server isn't ejected
+                ok = True
+                last_error = e
+                break
+            except requests.RequestException as e:
+                last_error = e  # Connection errors count toward ejection
+            finally:
+                self.release(backend, ok)
+        raise last_error or NoBackendAvailable("No Ollama backend available within the timeout.")
+
+    def broadcast(self, payload: Dict, timeout: Optional[float] = None) -> List[Dict]:
+        """Sends the same request to every healthy backend (e.g. model warm-up)."""
+        timeout = self.timeout if timeout is None else timeout
+        results = []
+        for backend in [b for b in self.backends if b.healthy]:
+            try:
+                resp = requests.post(backend.url, json=payload, timeout=timeout)
+                results.append({"url": backend.url, "ok": resp.status_code == 200})
+            except requests.RequestException as e:
+                results.append({"url": backend.url, "ok": False, "error": str(e)})
+        return results
+
+    # Health checks
+    def check_health(self):
+        for backend in self.backends:
+            try:
+                alive = requests.get(f"{backend.base_url}/api/tags", timeout=5).status_code == 200
+            except requests.RequestException:
+                alive = False
+
+            with self._cond:
+                if alive and not backend.healthy:
+                    backend.healthy = True
+                    backend.consecutive_failures = 0
+                    print(f"Ollama backend re-admitted: {backend.url}")
+                elif not alive and backend.healthy:
+                    backend.healthy = False
+                    print(f"Ollama backend ejected (health check): {backend.url}")
+                self._cond.notify_all()
+
+    def _health_loop(self):
+        while not self._stop.wait(self.health_interval):
+            self.check_health()
+
+    def start(self):
+        if self._health_thread and self._health_thread.is_alive():
+            return
+        self._stop.clear()
+        self._health_thread = threading.Thread(target=self._health_loop, name="ollama-health", daemon=True)
+        self._health_thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self) -> List[Dict]:
+        with self._cond:
+            return [b.status() for b in self.backends]
+
+# Global instance to be imported by services
+ollama_pool = OllamaPool()
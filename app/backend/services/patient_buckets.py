@@ -0,0 +1,95 @@
+import re
+from typing import Dict, List, Tuple
+
+# (upper bound exclusive, label)
+AGE_BANDS = [
+    (2, "infant (0-1)"),
+    (12, "child (2-11)"),
+    (18, "adolescent (12-17)"),
+    (40, "adult (18-39)"),
+    (65, "adult (40-64)"),
+    (80, "older adult (65-79)"),
+]
+OLDEST_BAND = "elderly (80+)"
+
+# WHO adult BMI classes: (upper bound exclusive, label)
+BMI_CLASSES = [
+    (18.5, "underweight"),
+    (25.0, "normal weight"),
+    (30.0, "overweight"),
+]
+OBESE_CLASS = "obese"
+
+SEX_ALIASES = {
+    "m": "male", "male": "male", "man": "male",
+    "f": "female", "female": "female", "woman": "female",
+}
+
+# Common abbreviations/variants folded to one condition name
+CONDITION_ALIASES = {
+    "ckd": "chronic kidney disease",
+    "renal failure": "chronic kidney disease",
+    "kidney disease": "chronic kidney disease",
+    "renal impairment": "chronic kidney disease",
+    "htn": "hypertension",
+    "high blood pressure": "hypertension",
+    "dm": "diabetes",
+    "t2dm": "diabetes",
+    "type 2 diabetes": "diabetes",
+    "type 1 diabetes": "diabetes",
+    "diabetes mellitus": "diabetes",
+    "chf": "heart failure",
+    "congestive heart failure": "heart failure",
+    "afib": "atrial fibrillation",
+    "af": "atrial fibrillation",
+    "copd": "chronic obstructive pulmonary disease",
+    "liver disease": "hepatic impairment",
+    "cirrhosis": "hepatic impairment",
+    "hepatic failure": "hepatic impairment",
+    "pregnant": "pregnancy",
+}
+
+_NON_WORD = re.compile(r"[^a-z0-9 ]+")
+_SPACES = re.compile(r"\s+")
+
+
+def age_band(age: int) -> str:
+    for upper, label in AGE_BANDS:
+        if age < upper:
+            return label
+    return OLDEST_BAND
+
+
+def bmi_class(weight: float, height: float) -> str:
+    if not weight or not height:
+        return "unknown BMI"
+    bmi = weight / ((height / 100) ** 2)
+    for upper, label in BMI_CLASSES:
+        if bmi < upper:
+            return label
+    return OBESE_CLASS
+
+
+def normalize_conditions(conditions: List[str]) -> Tuple[str, ...]:
+    normalized = set()
+    for cond in conditions or []:
+        text = _SPACES.sub(" ", _NON_WORD.sub(" ", str(cond).lower())).strip()
+        if text:
+            normalized.add(CONDITION_ALIASES.get(text, text))
+    return tuple(sorted(normalized))
+
+
+def bucket_patient(patient: Dict) -> Dict:
+    """
+    Maps an exact PatientProfile to clinically meaningful buckets so risk
+    assessments can be shared across patients with the same profile class.
+    """
+    sex = SEX_ALIASES.get(str(patient.get('gender', '')).strip().lower(), "unspecified sex")
+    bucket = {
+        "age_band": age_band(patient['age']),
+        "sex": sex,
+        "bmi_class": bmi_class(patient.get('weight'), patient.get('height')),
+        "conditions": normalize_conditions(patient.get('conditions')),
+    }
+    bucket["key"] = (bucket["age_band"], bucket["sex"], bucket["bmi_class"], bucket["conditions"])
+    return bucket
@@ -1,4 +1,5 @@
 from ..database import db_manager
+from ..metrics import span
 from typing import List, Dict
 
 class DrugResolver:
@@ -12,6 +13,10 @@ class DrugResolver:
         return None # type: ignore
 
     def resolve_input(self, user_inputs: List[str]) -> Dict[str, str]:
+        with span("resolver"):
+            return self._resolve(user_inputs)
+
+    def _resolve(self, user_inputs: List[str]) -> Dict[str, str]:
         resolved_map = {}
         for item in user_inputs:
             # 1. Check if it's a mixture/brand
@@ -29,4 +34,39 @@ class DrugResolver:
                 did = self._get_id_from_name(item)
                 if did: resolved_map[item] = did
                 
-        return resolved_map
\ No newline at end of file
+        return resolved_map
+
+    def resolve_batch(self, names: List[str]) -> Dict[str, Dict[str, str]]:
+        """
+        Bulk form of resolve_input for many medication lists at once:
+        two IN-list queries instead of two queries per name.
+        Returns {input name: {label: drugbank_id}} with the same labels as resolve_input.
+        """
+        with span("resolver.batch"):
+            names = list(dict.fromkeys(names))
+            if not names:
+                return {}
+
+            # First mixture row per name wins, as in resolve_input
+            placeholders = ",".join("?" * len(names))
+            mixtures = {}
+            for r in self.db.query(f"SELECT name, ingredients FROM mixtures WHERE name IN ({placeholders}) ORDER BY rowid", tuple(names)):
+                mixtures.setdefault(r['name'], [i.strip() for i in r['ingredients'].split('+')])
+
+            lookup = set(n for n in names if n not in mixtures)
+            for ingredients in mixtures.values():
+                lookup.update(ingredients)
+            ids = {}
+            if lookup:
+                placeholders = ",".join("?" * len(lookup))
+                sql = f"SELECT name, drugbank_id FROM general_info WHERE name IN ({placeholders}) AND type != 'brand' ORDER BY rowid"
+                for r in self.db.query(sql, tuple(lookup)):
+                    ids.setdefault(r['name'], r['drugbank_id'])
+
+            resolved = {}
+            for name in names:
+                if name in mixtures:
+                    resolved[name] = {f"{name} ({ing})": ids[ing] for ing in mixtures[name] if ing in ids}
+                else:
+                    resolved[name] = {name: ids[name]} if name in ids else {}
+            return resolved
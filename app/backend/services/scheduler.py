@@ -0,0 +1,153 @@
+import heapq
+import itertools
+import threading
+import time
+import contextvars
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from typing import Callable, Optional
+from ..config import LLM_WORKERS, LLM_QUEUE_MAX, LLM_DEADLINES_S
+from ..metrics import metrics
+
+# Lower number = served first
+PRIORITIES = {"interactive": 0, "standard": 1, "background": 2, "bulk": 3, "speculative": 4}
+
+# Absolute (monotonic) deadline shared by every LLM call of the current request
+_request_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "request_deadline", default=None
+)
+
+
+# Forces every LLM call in the block onto one priority class (e.g. bulk jobs)
+_priority_override: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "priority_override", default=None
+)
+
+
+class Overloaded(Exception):
+    """The call was shed (queue full) or could not start/finish before its deadline."""
+
+
+@contextmanager
+def request_deadline(seconds: float):
+    """Caps the total time all LLM calls made inside the block may take."""
+    token = _request_deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _request_deadline.reset(token)
+
+
+@contextmanager
+def llm_priority(priority: str):
+    token = _priority_override.set(priority)
+    try:
+        yield
+    finally:
+        _priority_override.reset(token)
+
+
+def effective_priority(priority: str) -> str:
+    return _priority_override.get() or priority
+
+
+class LLMScheduler:
+    """
+    Bounded priority queue in front of the Ollama pool.
+    Workers pull the most urgent call first; calls whose deadline passes while
+    queued are dropped, and when the queue is full the least urgent call is shed.
+    """
+    def __init__(self, workers: int = LLM_WORKERS, max_queue: int = LLM_QUEUE_MAX):
+        self.max_queue = max_queue
+        self._heap = []  # (priority, seq, deadline, fn, future)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        for i in range(workers):
+            threading.Thread(target=self._worker, name=f"llm-worker-{i}", daemon=True).start()
+
+    def deadline_for(self, priority: str) -> float:
+        deadline = time.monotonic() + LLM_DEADLINES_S[priority]
+        request_limit = _request_deadline.get()
+        return min(deadline, request_limit) if request_limit else deadline
+
+    def submit(self, fn: Callable[[float], object], priority: str = "standard", deadline: float = None) -> Future:
+        """Queues fn(deadline); the returned future fails with Overloaded if the call is shed."""
+        deadline = self.deadline_for(priority) if deadline is None else deadline
+        future = Future()
+        item = (PRIORITIES[priority], next(self._seq), deadline, fn, future)
+        future.enqueued_at = time.monotonic()
+        future.priority = priority
+
+        with self._cond:
+            if len(self._heap) >= self.max_queue:
+                self._purge_finished()
+            if len(self._heap) >= self.max_queue:
+                # Evict the least urgent queued call if the newcomer outranks it
+                worst = max(self._heap)
+                if worst[:2] < item[:2]:
+                    self._finish_shed(future, "queue full")
+                    return future
+                self._heap.remove(worst)
+                heapq.heapify(self._heap)
+                self._finish_shed(worst[4], "queue full")
+            heapq.heappush(self._heap, item)
+            self._cond.notify()
+        return future
+
+    def run(self, fn: Callable[[float], object], priority: str = "standard"):
+        """Submits fn and waits for it; raises Overloaded if it can't finish by its deadline."""
+        deadline = self.deadline_for(priority)
+        future = self.submit(fn, priority, deadline)
+        try:
+            return future.result(timeout=max(deadline - time.monotonic(), 0))
+        except FutureTimeout:
+            future.cancel()  # Workers skip it if it hasn't started yet
+            raise Overloaded("LLM deadline exceeded")
+
+    def cancel(self, future: Future) -> bool:
+        """Cancels a queued call and removes it from the queue; False if it already started."""
+        with self._cond:
+            if not future.cancel():
+                return False
+            self._heap = [item for item in self._heap if item[4] is not future]
+            heapq.heapify(self._heap)
+        return True
+
+    def queue_depth(self) -> int:
+        with self._cond:
+            return len(self._heap)
+
+    def _purge_finished(self):
+        """Drops entries whose caller cancelled them (or that already completed); caller holds the lock."""
+        live = [item for item in self._heap if not item[4].done()]
+        if len(live) != len(self._heap):
+            self._heap = live
+            heapq.heapify(self._heap)
+
+    def _finish_shed(self, future: Future, reason: str):
+        metrics.llm_queue_seconds.observe(time.monotonic() - future.enqueued_at, future.priority, "shed")
+        future.set_exception(Overloaded(reason))
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                _, _, deadline, fn, future = heapq.heappop(self._heap)
+
+            if not future.set_running_or_notify_cancel():
+                continue  # Caller gave up while it was queued
+            waited = time.monotonic() - future.enqueued_at
+            if time.monotonic() >= deadline:
+                metrics.llm_queue_seconds.observe(waited, future.priority, "expired")
+                future.set_exception(Overloaded("deadline passed while queued"))
+                continue
+
+            metrics.llm_queue_seconds.observe(waited, future.priority, "run")
+            try:
+                future.set_result(fn(deadline))
+            except Exception as e:
+                future.set_exception(e)
+
+# Global instance to be imported by services
+llm_scheduler = LLMScheduler()
@@ -0,0 +1,98 @@
+from typing import List, Dict, Optional, Set, Tuple
+from ..database import db_manager
+from ..cache import LRUCache
+from ..metrics import span
+from ..config import SEARCH_RESULT_LIMIT, SEARCH_TABLE_LIMIT, SEARCH_SESSION_CACHE_SIZE, SEARCH_SESSION_TTL_S
+
+Candidate = Tuple[str, str, str]  # (name, drugbank_id, type)
+
+# SQLite's LIKE only folds ASCII case; narrowing must match exactly what it would have returned
+_ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+
+def _like_fold(value: str) -> str:
+    return value.translate(_ASCII_LOWER)
+
+
+class DrugSearch:
+    """
+    Autocomplete over mixtures, generics and synonyms.
+    With a session token, the full candidate set of the last query is kept so that
+    an extended query ("war" -> "warf") is answered by filtering it in memory.
+    """
+    def __init__(self):
+        self.db = db_manager
+        self._sessions = LRUCache(SEARCH_SESSION_CACHE_SIZE, ttl=SEARCH_SESSION_TTL_S)  # token -> (term, candidates)
+        self.narrowed = 0
+        self.full_scans = 0
+
+    def search(self, term: str, session: Optional[str] = None) -> List[Dict]:
+        with span("search"):
+            return self._rank(term, self._candidates(term, session))
+
+    def _candidates(self, term: str, session: Optional[str]) -> Set[Candidate]:
+        # '%' and '_' are LIKE wildcards, which a substring filter can't reproduce
+        if not session or "%" in term or "_" in term:
+            candidates, _ = self._full_search(term, SEARCH_TABLE_LIMIT)
+            return candidates
+
+        term_lower = _like_fold(term)
+        cached = self._sessions.get(session)
+        # Every match for "warf" also matches "war", so a complete set for a substring can be filtered.
+        # Anything else (backspace, new word, expired session) needs a fresh scan.
+        if cached and cached[0] in term_lower:
+            candidates = {c for c in cached[1] if term_lower in _like_fold(c[0])}
+            self.narrowed += 1
+        else:
+            # Same per-table limit as session-less queries, so a session never changes the answer
+            candidates, complete = self._full_search(term, SEARCH_TABLE_LIMIT)
+            self.full_scans += 1
+            if not complete:
+                # Truncated sets can't be narrowed without missing rows
+                self._sessions.pop(session)
+                return candidates
+
+        self._sessions.put(session, (term_lower, candidates))
+        return candidates
+
+    def _full_search(self, term: str, limit: int) -> Tuple[Set[Candidate], bool]:
+        """Returns (candidates, complete); complete is False if any table hit the limit."""
+        pattern = f"%{term}%"
+        results = set()
+        complete = True
+
+        # Search Mixtures (Brands)
+        res_mix = self.db.query("SELECT name, drugbank_id FROM mixtures WHERE name LIKE ? LIMIT ?", (pattern, limit))
+        for r in res_mix:
+            results.add((r['name'], r['drugbank_id'], "Brand"))
+
+        # Search Generics
+        res_gen = self.db.query("SELECT name, drugbank_id FROM general_info WHERE name LIKE ? LIMIT ?", (pattern, limit))
+        for r in res_gen:
+            results.add((r['name'], r['drugbank_id'], "Generic"))
+
+        # Search Synonyms
+        res_syn = self.db.query("SELECT synonym, drugbank_id FROM synonyms WHERE synonym LIKE ? LIMIT ?", (pattern, limit))
+        for r in res_syn:
+            results.add((r['synonym'], r['drugbank_id'], "Synonym"))
+
+        for res in (res_mix, res_gen, res_syn):
+            if len(res) >= limit:
+                complete = False
+        return results, complete
+
+    def _rank(self, term: str, candidates: Set[Candidate]) -> List[Dict]:
+        # Sort: Starts With -> Length
+        q_lower = term.lower()
+
+        def sort_key(item):
+            starts_with = 0 if item[0].lower().startswith(q_lower) else 1
+            return (starts_with, len(item[0]))
+
+        return [
+            {"name": name, "id": did, "type": dtype}
+            for name, did, dtype in sorted(candidates, key=sort_key)[:SEARCH_RESULT_LIMIT]
+        ]
+
+    def stats(self) -> dict:
+        return {**self._sessions.stats(), "narrowed": self.narrowed, "full_scans": self.full_scans}
@@ -0,0 +1,88 @@
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Hashable, Optional
+from ..config import LLM_DEADLINES_S, SPECULATIVE_MAX_PENDING
+from .scheduler import LLMScheduler, llm_scheduler
+
+
+class SpeculativeWork:
+    """
+    Registry of speculative LLM calls (scheduler futures), keyed by what they compute.
+    A request that needs the same result claims it: finished or running work is used,
+    work still queued is cancelled so the request can run it at its own priority.
+    Entries nobody claims are cancelled once their TTL passes.
+    """
+    def __init__(self, scheduler: LLMScheduler = None, ttl: float = LLM_DEADLINES_S["speculative"],
+                 max_pending: int = SPECULATIVE_MAX_PENDING):
+        self.scheduler = scheduler or llm_scheduler
+        self.ttl = ttl
+        self.max_pending = max_pending
+        self._pending = {}  # key -> (expires_at, future)
+        self._lock = threading.Lock()
+        self.claimed = 0
+        self.cancelled = 0
+        self.expired = 0
+        self.failed = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._pending
+
+    def has_room(self) -> bool:
+        self.sweep()
+        with self._lock:
+            return len(self._pending) < self.max_pending
+
+    def add(self, key: Hashable, future: Future):
+        with self._lock:
+            self._pending[key] = (time.monotonic() + self.ttl, future)
+
+    def discard(self, key: Hashable):
+        """Drops an entry whose result the caller already has (e.g. from a cache)."""
+        with self._lock:
+            self._pending.pop(key, None)
+
+    def claim(self, key: Hashable, deadline: float) -> Optional[Any]:
+        """Returns the speculative result for key, or None if the caller should compute it."""
+        with self._lock:
+            entry = self._pending.pop(key, None)
+        if entry is None:
+            return None
+
+        future = entry[1]
+        if future.cancelled():
+            return None  # A shared chunk call another description already cancelled
+        if self.scheduler.cancel(future):
+            # Still queued at the lowest priority; waiting on it would invert priorities.
+            # Cancelling also frees its slot in the LLM queue.
+            self.cancelled += 1
+            return None
+        try:
+            result = future.result(timeout=max(deadline - time.monotonic(), 0))
+        except Exception:  # Shed, expired, timed out or the call itself failed
+            self.failed += 1
+            return None
+        self.claimed += 1
+        return result
+
+    def sweep(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [k for k, (expires_at, _) in self._pending.items() if expires_at < now]
+            futures = [self._pending.pop(k)[1] for k in expired]
+        # cancel() is False for calls that already ran; only count work actually dropped (once per shared future)
+        dropped = {id(f): f for f in futures if not f.cancelled()}
+        self.expired += sum(1 for future in dropped.values() if self.scheduler.cancel(future))
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "pending": pending,
+            "max_pending": self.max_pending,
+            "claimed": self.claimed,
+            "cancelled": self.cancelled,
+            "expired": self.expired,
+            "failed": self.failed
+        }
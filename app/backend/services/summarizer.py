@@ -1,16 +1,83 @@
-import requests
 import json
-from typing import List, Dict, Any
+import time
+from typing import List, Dict, Any, Tuple
 from ..database import db_manager
-from ..config import OLLAMA_URL, MODEL_NAME
+from ..config import (
+    MODEL_NAME, MODEL_CONTEXT_TOKENS, SEVERITY_BATCH_MAX, MAX_PROMPT_TOKENS,
+    OLLAMA_KEEP_ALIVE, CONTEXT_CACHE_SIZE, RISK_CACHE_SIZE, SEVERITY_CACHE_SIZE,
+    JOB_OVERLOAD_RETRIES, JOB_OVERLOAD_BACKOFF_S
+)
+from ..metrics import timed, record_llm_call
+from ..cache import LRUCache
+from .ollama_pool import OllamaPool, ollama_pool
+from .scheduler import LLMScheduler, Overloaded, llm_scheduler, effective_priority
+from .speculative import SpeculativeWork
+from .documents import drug_documents
+from .condense import estimate_tokens, fit_fields
+from .patient_buckets import bucket_patient
+
+SEVERITY_LEVELS = {"high": "High", "moderate": "Moderate", "low": "Low"}
+
+SEVERITY_RULES = """RULES:
+            - HIGH: Life-threatening, permanent damage, intracranial pressure, hospitalization.
+            - MODERATE: Therapy modification/monitoring required.
+            - LOW: Minor effects."""
+
+# Scheduler priority per task: severity is what the UI shows first
+TASK_PRIORITY = {
+    "severity": "interactive",
+    "mechanism": "standard",
+    "risk": "standard",
+    "recommendation": "background",
+}
 
 class ClinicalSummarizer:
     """Context & LLM Generation"""
     
-    def __init__(self):
+    def __init__(self, pool: OllamaPool = None, scheduler: LLMScheduler = None):
         self.db = db_manager
+        self.pool = pool or ollama_pool
+        self.scheduler = scheduler or llm_scheduler
+        self._has_condensed = None
+        self._context_cache = LRUCache(CONTEXT_CACHE_SIZE)
+        self._risk_cache = LRUCache(RISK_CACHE_SIZE)
+        self._severity_cache = LRUCache(SEVERITY_CACHE_SIZE)
+        self.speculative = SpeculativeWork(self.scheduler)  # (task, description) -> queued/running LLM call
+
+    def _pharmacology_table(self) -> str:
+        # Prefer the precondensed table built by SQL_Builder; fall back to raw DrugBank text
+        if self._has_condensed is None:
+            res = self.db.query("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'drug_context'")
+            self._has_condensed = bool(res)
+        return "drug_context" if self._has_condensed else "pharmacology"
 
     def get_drug_context(self, drug_id: str) -> Dict:
+        # Contexts are read-only DrugBank data, so an LRU cache is always safe
+        context = self._context_cache.get(drug_id)
+        if context is None:
+            context = self._load_drug_context(drug_id)
+            self._context_cache.put(drug_id, context)
+        return dict(context)
+
+    def preload_contexts(self, top_n: int) -> int:
+        """Caches contexts for the drugs that appear in the most interactions."""
+        res = self.db.query(
+            "SELECT drugbank_id FROM drug_interactions GROUP BY drugbank_id ORDER BY COUNT(*) DESC LIMIT ?",
+            (top_n,)
+        )
+        for r in res:
+            self.get_drug_context(r['drugbank_id'])
+        return len(res)
+
+    def warm_up(self) -> List[Dict]:
+        """Loads MODEL_NAME into memory on every backend (empty prompt = load only)."""
+        return self.pool.broadcast({"model": MODEL_NAME, "prompt": "", "stream": False, "keep_alive": OLLAMA_KEEP_ALIVE})
+
+    def _load_drug_context(self, drug_id: str) -> Dict:
+        doc = drug_documents.get(drug_id)
+        if doc:
+            return doc['context']
+
         context = {}
         # General Info
         res = self.db.query("SELECT name, description FROM general_info WHERE drugbank_id = ?", (drug_id,))
@@ -19,28 +86,85 @@ class ClinicalSummarizer:
             context['desc'] = res[0]['description']
         
         # Pharmacology
-        res = self.db.query("SELECT * FROM pharmacology WHERE drugbank_id = ?", (drug_id,))
+        res = self.db.query(f"SELECT * FROM {self._pharmacology_table()} WHERE drugbank_id = ?", (drug_id,))
         if res:
             pharm_data = dict(res[0])
             context.update({k: v for k, v in pharm_data.items() if v})
             
         return context
 
-    def _call_llm(self, prompt: str, temp: float = 0.1) -> Dict:
+    def _llm_payload(self, prompt: str, temp: float) -> Dict:
+        return {
+            "model": MODEL_NAME,
+            "prompt": prompt,
+            "stream": False,
+            # num_ctx pins the window the severity packing budget (MODEL_CONTEXT_TOKENS) assumes
+            "options": {"temperature": temp, "num_ctx": MODEL_CONTEXT_TOKENS},
+            "format": "json",
+            "keep_alive": OLLAMA_KEEP_ALIVE
+        }
+
+    def _call_llm(self, prompt: str, temp: float = 0.1, task: str = "generic") -> Dict:
+        start = time.perf_counter()
+        prompt_tokens, completion_tokens = None, None
+        payload = self._llm_payload(prompt, temp)
         try:
-            resp = requests.post(OLLAMA_URL, json={
-                "model": MODEL_NAME,
-                "prompt": prompt,
-                "stream": False,
-                "options": {"temperature": temp},
-                "format": "json" 
-            })
-            if resp.status_code == 200:
-                return json.loads(resp.json()['response'])
+            # Queued by priority; the HTTP timeout is whatever is left of the deadline
+            body = self._run_scheduled(
+                lambda deadline: self.pool.generate(payload, timeout=max(deadline - time.monotonic(), 1)),
+                effective_priority(TASK_PRIORITY.get(task, "standard"))
+            )
+            # Ollama eval stats: tokens in the prompt and in the generated response
+            prompt_tokens = body.get('prompt_eval_count')
+            completion_tokens = body.get('eval_count')
+            return json.loads(body['response'])
+        except Overloaded as e:
+            print(f"LLM Shed ({task}): {e}")
             return None
         except Exception as e:
             print(f"LLM Error: {e}")
             return None
+        finally:
+            record_llm_call(task, time.perf_counter() - start, prompt_tokens, completion_tokens)
+
+    def _run_scheduled(self, fn, priority: str):
+        # Nobody is waiting on bulk work, so a shed/expired bulk call backs off and re-queues instead of falling back
+        retries = JOB_OVERLOAD_RETRIES if priority == "bulk" else 0
+        for attempt in range(retries + 1):
+            try:
+                return self.scheduler.run(fn, priority)
+            except Overloaded:
+                if attempt == retries:
+                    raise
+                time.sleep(JOB_OVERLOAD_BACKOFF_S * 2 ** attempt)
+
+    def _call_llm_speculative(self, prompt: str, temp: float, task: str, deadline: float) -> Dict:
+        """Runs on a scheduler worker; errors propagate to whoever claims the future."""
+        start = time.perf_counter()
+        body = {}
+        try:
+            body = self.pool.generate(self._llm_payload(prompt, temp), timeout=max(deadline - time.monotonic(), 1))
+            return json.loads(body['response'])
+        finally:
+            record_llm_call(f"{task}.speculative", time.perf_counter() - start, body.get('prompt_eval_count'), body.get('eval_count'))
+
+    def _claim_speculative(self, task: str, description: str) -> Dict:
+        """Result of a speculative call for (task, description), or None if this request must make it."""
+        result = self.speculative.claim((task, description), self.scheduler.deadline_for(TASK_PRIORITY[task]))
+        return result.get(description) if result else None
+
+    def _cap_prompt(self, build_prompt, context_text: Dict, variable_text: Dict[str, str]) -> str:
+        """
+        Keeps build_prompt(context, text) under MAX_PROMPT_TOKENS.
+        The drug context is trimmed first; the request's own text (interaction
+        description, patient lines) only when the template plus that text is already over.
+        """
+        template = estimate_tokens(build_prompt({}, {k: "" for k in variable_text}))
+        text = fit_fields({"": variable_text}, max(MAX_PROMPT_TOKENS - template, 0))[""]
+        overhead = estimate_tokens(build_prompt({}, text))
+        prompt = build_prompt(fit_fields(context_text, max(MAX_PROMPT_TOKENS - overhead, 0)), text)
+        # Drug/field names survive trimming; if even those don't fit, send no context
+        return prompt if estimate_tokens(prompt) <= MAX_PROMPT_TOKENS else build_prompt({}, text)
 
     def _sanitize_string(self, value: Any, default: str) -> str:
         """
@@ -64,37 +188,183 @@ class ClinicalSummarizer:
                 
         return str(value)
 
+    # 0. Speculative Precompute
+    def speculate(self, interactions: List[Dict]) -> int:
+        """
+        Queues the patient-independent work a following report will need (severity,
+        mechanism summary) at the lowest priority, and loads the drug contexts.
+        Returns the number of LLM calls queued.
+        """
+        descriptions = list(dict.fromkeys(inter['description'] for inter in interactions))
+        queued = 0
+
+        severity_pending = [
+            d for d in descriptions
+            if self._severity_cache.get(d) is None and ("severity", d) not in self.speculative
+        ]
+        for chunk in self._pack_severity_chunks(severity_pending):
+            if not self.speculative.has_room():
+                break
+            # One batched call per chunk; every description in it claims the same future
+            future = self.scheduler.submit(lambda deadline, c=chunk: self._speculate_severity(c, deadline), "speculative")
+            for desc in chunk:
+                self.speculative.add(("severity", desc), future)
+            queued += 1
+
+        for desc in descriptions:
+            if ("mechanism", desc) in self.speculative or not self.speculative.has_room():
+                continue
+            future = self.scheduler.submit(
+                lambda deadline, d=desc: {d: self._call_llm_speculative(self._summary_prompt(d), 0.2, "mechanism", deadline)},
+                "speculative"
+            )
+            self.speculative.add(("mechanism", desc), future)
+            queued += 1
+
+        for inter in interactions:
+            self.get_drug_context(inter['drug_a'])
+            self.get_drug_context(inter['drug_b'])
+        return queued
+
+    def _speculate_severity(self, descriptions: List[str], deadline: float) -> Dict[str, Dict]:
+        if len(descriptions) == 1:
+            data = self._call_llm_speculative(self._severity_single_prompt(descriptions[0]), 0.0, "severity", deadline)
+            item = self._valid_severity(data)
+            classified = {descriptions[0]: item} if item else {}
+        else:
+            data = self._call_llm_speculative(self._severity_batch_prompt(descriptions), 0.0, "severity", deadline)
+            classified = self._parse_severity_batch(descriptions, data)
+        # Cached right away, so it's used even if the claim arrives after the TTL
+        for desc, item in classified.items():
+            self._severity_cache.put(desc, item)
+        return classified
+
     # 1. Severity
+    @timed("summarizer.severity")
     def classify_severity_batch(self, interactions: List[Dict]) -> List[Dict]:
+        # Identical descriptions share one classification; temp 0 output is cached per description
+        descriptions = list(dict.fromkeys(inter['description'] for inter in interactions))
+        classified = {d: self._severity_cache.get(d) for d in descriptions}
+        pending = [d for d in descriptions if classified[d] is None]
+
+        # Precomputed by /analyze/interactions (finished, or waited on if already running)
+        for desc in descriptions:
+            if classified[desc] is not None:
+                self.speculative.discard(("severity", desc))
+        for desc in pending:
+            classified[desc] = self._claim_speculative("severity", desc)
+        pending = [d for d in pending if classified[d] is None]
+
+        no_retry = set()
+        for chunk in self._pack_severity_chunks(pending):
+            chunk_results, answered = self._classify_severity_chunk(chunk)
+            classified.update(chunk_results)
+            # One-item chunks already used the single prompt; re-sending it at temp 0 gives the same answer
+            if not answered or len(chunk) == 1:
+                no_retry.update(chunk)
+
+        # Items the batched prompt didn't return valid JSON for are re-run on their own.
+        # If the LLM didn't answer at all (shed/error), don't pile single calls on top.
+        for desc in pending:
+            if not classified.get(desc) and desc not in no_retry:
+                classified[desc] = self._classify_severity_single(desc)
+            # Only validated levels are cached (batch entries and single results alike)
+            if classified.get(desc):
+                self._severity_cache.put(desc, classified[desc])
+
         results = []
         for inter in interactions:
-            prompt = f"""
-            Classify severity. Description: "{inter['description']}"
-            RULES:
-            - HIGH: Life-threatening, permanent damage, intracranial pressure, hospitalization.
-            - MODERATE: Therapy modification/monitoring required.
-            - LOW: Minor effects.
-            Return JSON: {{ "severity": "High/Moderate/Low", "reason": "Short 5-word summary" }}
-            """
-            data = self._call_llm(prompt, 0.0)
+            data = classified.get(inter['description'])
             results.append({
                 "drug_a": inter['drug_a'],
                 "drug_b": inter['drug_b'],
                 "severity": self._sanitize_string(data.get("severity") if data else None, "Unknown"),
-                "short_reason": self._sanitize_string(data.get("reason") if data else None, "Analysis failed")
+                "short_reason": self._sanitize_string(data.get("reason") if data else None, "Analysis failed"),
+                "degraded": not (data and data.get("severity"))
             })
         return results
 
+    def _pack_severity_chunks(self, descriptions: List[str]) -> List[List[str]]:
+        """
+        Greedily packs descriptions into prompts that fit the model's context window.
+        Each item costs its description plus the JSON entry it produces.
+        """
+        per_item_output = 30
+        budget = MODEL_CONTEXT_TOKENS - estimate_tokens(self._severity_batch_prompt([]))
+        chunks, current, used = [], [], 0
+        for desc in descriptions:
+            cost = estimate_tokens(desc) + per_item_output
+            if current and (used + cost > budget or len(current) >= SEVERITY_BATCH_MAX):
+                chunks.append(current)
+                current, used = [], 0
+            current.append(desc)
+            used += cost
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def _severity_batch_prompt(self, descriptions: List[str]) -> str:
+        items = "\n".join(f'            [{i}] "{desc}"' for i, desc in enumerate(descriptions))
+        return f"""
+            Classify the severity of each drug interaction below.
+            {SEVERITY_RULES}
+            Interactions:
+{items}
+            Return JSON with exactly one entry per index:
+            {{ "results": [ {{ "index": 0, "severity": "High/Moderate/Low", "reason": "Short 5-word summary" }} ] }}
+            """
+
+    def _classify_severity_chunk(self, descriptions: List[str]) -> Tuple[Dict[str, Dict], bool]:
+        """Returns (classified items, whether the LLM answered at all)."""
+        if len(descriptions) == 1:
+            data = self._call_llm(self._severity_single_prompt(descriptions[0]), 0.0, task="severity")
+            item = self._valid_severity(data)
+            return ({descriptions[0]: item} if item else {}), data is not None
+
+        data = self._call_llm(self._severity_batch_prompt(descriptions), 0.0, task="severity")
+        if data is None:
+            return {}, False
+        return self._parse_severity_batch(descriptions, data), True
+
+    def _parse_severity_batch(self, descriptions: List[str], data: Any) -> Dict[str, Dict]:
+        entries = data.get("results") if isinstance(data, dict) else None
+        if not isinstance(entries, list):
+            return {}
+
+        # Keep only entries that map to a known index and a valid severity level
+        classified = {}
+        for entry in entries:
+            item = self._valid_severity(entry)
+            idx = entry.get("index") if item else None
+            if isinstance(idx, int) and 0 <= idx < len(descriptions):
+                classified[descriptions[idx]] = item
+        return classified
+
+    def _valid_severity(self, data: Any) -> Dict:
+        """Normalized {"severity", "reason"} if data carries a known severity level, else None."""
+        if not isinstance(data, dict):
+            return None
+        level = SEVERITY_LEVELS.get(str(data.get("severity", "")).strip().lower())
+        return {"severity": level, "reason": data.get("reason")} if level else None
+
+    def _severity_single_prompt(self, description: str) -> str:
+        return f"""
+            Classify severity. Description: "{description}"
+            {SEVERITY_RULES}
+            Return JSON: {{ "severity": "High/Moderate/Low", "reason": "Short 5-word summary" }}
+            """
+
+    def _classify_severity_single(self, description: str) -> Dict:
+        return self._valid_severity(self._call_llm(self._severity_single_prompt(description), 0.0, task="severity"))
+
     # 2. Interaction Summary
+    @timed("summarizer.mechanism")
     def generate_interaction_summary_batch(self, interactions: List[Dict]) -> List[Dict]:
         results = []
         for inter in interactions:
-            prompt = f"""
-            Summarize this drug interaction in 1 clear sentence for a doctor.
-            Input Description: "{inter['description']}"
-            Return JSON: {{ "summary": "..." }}
-            """
-            data = self._call_llm(prompt, 0.2)
+            data = self._claim_speculative("mechanism", inter['description'])
+            if data is None:
+                data = self._call_llm(self._summary_prompt(inter['description']), 0.2, task="mechanism")
             
             summary_text = inter['description'] # Fallback
             if data:
@@ -103,11 +373,20 @@ class ClinicalSummarizer:
             results.append({
                 "drug_a": inter['drug_a'],
                 "drug_b": inter['drug_b'],
-                "interaction_summary": summary_text
+                "interaction_summary": summary_text,
+                "degraded": not (data and data.get("summary"))
             })
         return results
 
+    def _summary_prompt(self, description: str) -> str:
+        return f"""
+            Summarize this drug interaction in 1 clear sentence for a doctor.
+            Input Description: "{description}"
+            Return JSON: {{ "summary": "..." }}
+            """
+
     # 3. Clinical Recommendations
+    @timed("summarizer.recommendation")
     def generate_recommendation_batch(self, interactions: List[Dict], drug_contexts: Dict) -> List[Dict]:
         results = []
         for inter in interactions:
@@ -127,27 +406,54 @@ class ClinicalSummarizer:
                 ctx_b.get('name', id_b): extract_recomm_fields(ctx_b)
             }
 
-            prompt = f"""
+            def build_prompt(context, text):
+                return f"""
             Provide a CLINICAL RECOMMENDATION (2-3 lines).
             Include specific timing/spacing advice if applicable based on pharmacology (e.g. half-life, absorption).
-            Interaction: "{inter['description']}"
-            Context: {json.dumps(context_text)}
+            Interaction: "{text['description']}"
+            Context: {json.dumps(context)}
             Return JSON: {{ "recommendation": "..." }}
             """
+
+            prompt = self._cap_prompt(build_prompt, context_text, {"description": inter['description']})
             
-            data = self._call_llm(prompt, 0.2)
+            data = self._call_llm(prompt, 0.2, task="recommendation")
             results.append({
                 "drug_a": inter['drug_a'],
                 "drug_b": inter['drug_b'],
-                "recommendation": self._sanitize_string(data.get("recommendation") if data else None, "Monitor patient closely.")
+                "recommendation": self._sanitize_string(data.get("recommendation") if data else None, "Monitor patient closely."),
+                "degraded": not (data and data.get("recommendation"))
             })
         return results
 
     # 4. Patient Risk
-    def generate_risk_batch(self, interactions: List[Dict], drug_contexts: Dict, patient: Dict) -> List[Dict]:
+    @timed("summarizer.risk")
+    def generate_risk_batch(self, interactions: List[Dict], drug_contexts: Dict, patient: Dict, bucketed: bool = False) -> List[Dict]:
+        """
+        bucketed=True assesses risk for the patient's profile bucket (age band, sex,
+        BMI class, normalized conditions) instead of exact values, and caches the
+        result per (pair, bucket) so other patients in the same bucket reuse it.
+        """
+        # Bucket key is also used to serve a precomputed bucketed result when the LLM is unavailable
+        bucket = bucket_patient(patient)
+        if bucketed:
+            patient_lines = f"""Patient: {bucket['age_band']} {bucket['sex']}
+            Body size: {bucket['bmi_class']}
+            Conditions: {', '.join(bucket['conditions']) or 'None reported'}"""
+        else:
+            patient_lines = f"""Patient: {patient['age']} year old {patient['gender']}
+            Weight: {patient.get('weight', 'N/A')} kg, Height: {patient.get('height', 'N/A')} cm
+            Conditions: {', '.join(patient.get('conditions', []))}"""
+
         results = []
         for inter in interactions:
             id_a, id_b = inter['drug_a'], inter['drug_b']
+            cache_key = (min(id_a, id_b), max(id_a, id_b), bucket['key'])
+            cached = self._risk_cache.get(cache_key) if bucketed else None
+            if cached:
+                results.append({"drug_a": id_a, "drug_b": id_b, "patient_risk": cached, "bucketed": True, "degraded": False})
+                continue
+
             ctx_a = drug_contexts.get(id_a, {})
             ctx_b = drug_contexts.get(id_b, {})
             
@@ -163,32 +469,49 @@ class ClinicalSummarizer:
                 ctx_b.get('name', id_b): extract_risk_fields(ctx_b)
             }
             
-            prompt = f"""
+            def build_prompt(context, text):
+                return f"""
             Assess PATIENT SPECIFIC RISK.
-            Patient: {patient['age']} year old {patient['gender']}
-            Weight: {patient.get('weight', 'N/A')} kg, Height: {patient.get('height', 'N/A')} cm
-            Conditions: {', '.join(patient.get('conditions', []))}
-            Interaction: "{inter['description']}"
-            Context: {json.dumps(context_text)}
+            {text['patient']}
+            Interaction: "{text['description']}"
+            Context: {json.dumps(context)}
             Return JSON: {{ "patient_risk": "Single string explaining risk." }}
             """
+
+            prompt = self._cap_prompt(
+                build_prompt, context_text, {"patient": patient_lines, "description": inter['description']}
+            )
             
-            data = self._call_llm(prompt, 0.1)
+            data = self._call_llm(prompt, 0.1, task="risk")
+            answered = bool(data and data.get("patient_risk"))
+            risk_text = self._sanitize_string(data.get("patient_risk") if data else None, "Standard risk profile.")
+            used_bucket = bucketed
+            # Only real LLM output is cached, never the fallback
+            if bucketed and answered:
+                self._risk_cache.put(cache_key, risk_text)
+            elif not answered:
+                # Degraded: a precomputed assessment for the patient's bucket beats the generic fallback
+                precomputed = self._risk_cache.get(cache_key)
+                if precomputed:
+                    risk_text, used_bucket = precomputed, True
+
             results.append({
                 "drug_a": inter['drug_a'],
                 "drug_b": inter['drug_b'],
-                "patient_risk": self._sanitize_string(data.get("patient_risk") if data else None, "Standard risk profile.")
+                "patient_risk": risk_text,
+                "bucketed": used_bucket,
+                "degraded": not answered
             })
         return results
 
     # 5. Orchestrator
-    def generate_structured_analysis(self, interactions: List[Dict], drug_contexts: Dict, patient: Dict) -> List[Dict]:
+    def generate_structured_analysis(self, interactions: List[Dict], drug_contexts: Dict, patient: Dict, bucketed: bool = False) -> List[Dict]:
         cards = []
         
         # Sequential execution of sub-tasks
         summaries = self.generate_interaction_summary_batch(interactions)
         recomms = self.generate_recommendation_batch(interactions, drug_contexts)
-        risks = self.generate_risk_batch(interactions, drug_contexts, patient)
+        risks = self.generate_risk_batch(interactions, drug_contexts, patient, bucketed)
         
         for i, inter in enumerate(interactions):
             id_a = inter['drug_a']
@@ -203,7 +526,9 @@ class ClinicalSummarizer:
                 "severity": "Unknown", 
                 "interaction_summary": summaries[i]['interaction_summary'],
                 "recommendation": recomms[i]['recommendation'],
-                "patient_risk": risks[i]['patient_risk']
+                "patient_risk": risks[i]['patient_risk'],
+                "bucketed": risks[i]['bucketed'],
+                "degraded": summaries[i]['degraded'] or recomms[i]['degraded'] or risks[i]['degraded']
             })
             
         return cards
\ No newline at end of file
@@ -0,0 +1,114 @@
+"""
+Read-path benchmark: materialized drug_documents (one indexed read + decompress)
+vs. the normalized tables (name, food and four ref_* queries per drug, plus context),
+and the space each layout takes in the database.
+
+Build the database with sqlite_builder/SQL_Builder.py first, then run from the project root:
+    python benchmarks/bench_documents.py [path/to/db]
+"""
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.backend.config import DB_FILE
+from app.backend.database import db_manager
+from app.backend.services.documents import DrugDocuments, REFERENCE_SOURCES
+
+REQUESTS = 300
+DRUGS_PER_REQUEST = 5  # The UI's medication limit
+NORMALIZED_TABLES = ["food_interactions", "drug_context"] + [table for table, _, _ in REFERENCE_SOURCES.values()]
+
+
+def normalized_read(store: DrugDocuments, drug_ids):
+    # What /analyze/food, /analyze/references and the context loader do without documents
+    food = store.food_warnings(drug_ids)
+    refs = store.references(drug_ids)
+    contexts = {}
+    for uid in drug_ids:
+        res = db_manager.query("SELECT name, description FROM general_info WHERE drugbank_id = ?", (uid,))
+        ctx = {"name": res[0]['name'], "desc": res[0]['description']} if res else {}
+        res = db_manager.query("SELECT * FROM drug_context WHERE drugbank_id = ?", (uid,))
+        if res:
+            ctx.update({k: v for k, v in dict(res[0]).items() if v})
+        contexts[uid] = ctx
+    return food, refs, contexts
+
+
+def document_read(store: DrugDocuments, drug_ids):
+    # The endpoints each read the documents once; contexts come from the same rows
+    food = store.food_warnings(drug_ids)
+    refs = store.references(drug_ids)
+    contexts = {uid: doc['context'] for uid, doc in store.get_many(drug_ids).items()}
+    return food, refs, contexts
+
+
+def time_reads(fn, store, batches):
+    samples = []
+    for ids in batches:
+        start = time.perf_counter()
+        fn(store, ids)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.mean(samples), samples[len(samples) // 2], samples[int(len(samples) * 0.95)]
+
+
+def object_sizes(db_path):
+    """Bytes per table/index from the dbstat virtual table (None if SQLite lacks it)."""
+    conn = sqlite3.connect(db_path)
+    try:
+        sizes = dict(conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name").fetchall())
+        owners = dict(conn.execute("SELECT name, tbl_name FROM sqlite_master").fetchall())
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+
+    totals = {}
+    for name, size in sizes.items():
+        table = owners.get(name, name)
+        totals[table] = totals.get(table, 0) + size  # Indexes count towards their table
+    return totals
+
+
+def main():
+    db_path = sys.argv[1] if len(sys.argv) > 1 else DB_FILE
+    db_manager.db_file = db_path
+    db_manager.trace = False  # Measure the reads, not the query tracer
+
+    documents = DrugDocuments()
+    if not documents.available():
+        print(f"{db_path} has no drug_documents table; rebuild it with sqlite_builder/SQL_Builder.py")
+        return
+    normalized = DrugDocuments()
+    normalized._available = False  # Force the normalized-table path
+
+    ids = [r['drugbank_id'] for r in db_manager.query("SELECT drugbank_id FROM drug_documents")]
+    rng = random.Random(42)
+    batches = [rng.sample(ids, min(DRUGS_PER_REQUEST, len(ids))) for _ in range(REQUESTS)]
+
+    # Warm both paths once so the OS page cache doesn't favour the second run
+    time_reads(normalized_read, normalized, batches[:20])
+    time_reads(document_read, documents, batches[:20])
+
+    print(f"{REQUESTS} reads of {DRUGS_PER_REQUEST} drugs (food + references + context)")
+    print(f"{'layout':<14}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for label, fn, store in (("normalized", normalized_read, normalized), ("documents", document_read, documents)):
+        mean, p50, p95 = time_reads(fn, store, batches)
+        print(f"{label:<14}{mean:>10.2f}{p50:>10.2f}{p95:>10.2f}")
+
+    sizes = object_sizes(db_path)
+    print(f"\nDatabase file: {os.path.getsize(db_path):,} bytes")
+    if sizes is None:
+        print("(SQLite built without dbstat; per-table sizes unavailable)")
+        return
+    normalized_bytes = sum(sizes.get(t, 0) for t in NORMALIZED_TABLES)
+    print(f"normalized ({', '.join(NORMALIZED_TABLES)}): {normalized_bytes:,} bytes incl. indexes")
+    print(f"drug_documents: {sizes.get('drug_documents', 0):,} bytes incl. index")
+
+
+if __name__ == "__main__":
+    main()
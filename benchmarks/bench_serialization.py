@@ -0,0 +1,95 @@
+"""
+Serialization micro-benchmark: Pydantic response_model + stdlib json (old path)
+vs. direct orjson (new path), plus bytes on the wire with gzip/brotli.
+
+Run from the project root:
+    python benchmarks/bench_serialization.py
+"""
+import gzip
+import json
+import os
+import sys
+import timeit
+
+import orjson
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.backend.schemas import InteractionResponse, ReferenceResponse, ReportResponse
+from app.backend.config import GZIP_LEVEL, BROTLI_QUALITY
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CITATION = ("Smythe MA, Stephens JL, Koerber JM, Mattson JC: A comparison of lepirudin and "
+            "argatroban outcomes. Clin Appl Thromb Hemost. 2005 Oct;11(4):371-4.")
+
+
+def build_payloads(n_drugs: int):
+    ids = [f"DB{i:05d}" for i in range(n_drugs)]
+    pairs = [(a, b) for i, a in enumerate(ids) for b in ids[i + 1:]]
+
+    interactions = {
+        "resolved_medications": {f"Drug {d}": d for d in ids},
+        "interactions_found": [
+            {"drug_a": a, "drug_b": b, "description": f"The risk or severity of adverse effects can be increased when {a} is combined with {b}."}
+            for a, b in pairs
+        ]
+    }
+    references = {
+        "references": {
+            f"Drug {d}": {
+                "articles": [f"{CITATION} (PMID: {16244762 + k})" for k in range(5)],
+                "links": [f"FDA Label {k}: https://www.accessdata.fda.gov/drugsatfda_docs/label/{d}_{k}.pdf" for k in range(5)],
+                "attachments": [f"Monograph {k}: https://www.drugbank.ca/system/{d}/{k}.pdf" for k in range(3)],
+                "books": [f"Brunton LL: Goodman & Gilman's Pharmacological Basis of Therapeutics (ISBN: 978007162442{k})" for k in range(2)]
+            }
+            for d in ids
+        }
+    }
+    report = {
+        "clinical_analysis": "See cards below",
+        "analysis_cards": [
+            {
+                "drug_a": a, "drug_b": b, "severity": "Moderate",
+                "interaction_summary": "Combined use increases bleeding risk through additive antiplatelet effects.",
+                "recommendation": "Monitor INR closely for the first two weeks; separate doses by at least 2 hours.",
+                "patient_risk": "Elderly patient with reduced renal clearance is at elevated risk of accumulation."
+            }
+            for a, b in pairs
+        ]
+    }
+    return [
+        ("interactions", InteractionResponse, interactions),
+        ("references", ReferenceResponse, references),
+        ("report", ReportResponse, report),
+    ]
+
+
+def old_path(model, payload) -> bytes:
+    # What FastAPI did before: validate against response_model, then stdlib json
+    validated = model.model_validate(payload)
+    return json.dumps(validated.model_dump(), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def new_path(payload) -> bytes:
+    return orjson.dumps(payload)
+
+
+def main():
+    number = 200
+    print(f"{'payload':<24}{'stdlib+validate':>16}{'orjson':>10}{'raw B':>10}{'gzip B':>10}{'br B':>10}")
+    for n_drugs in (5, 25):
+        for name, model, payload in build_payloads(n_drugs):
+            old_us = timeit.timeit(lambda: old_path(model, payload), number=number) / number * 1e6
+            new_us = timeit.timeit(lambda: new_path(payload), number=number) / number * 1e6
+            body = new_path(payload)
+            gz = len(gzip.compress(body, compresslevel=GZIP_LEVEL))
+            br = len(brotli.compress(body, quality=BROTLI_QUALITY)) if brotli else "-"
+            label = f"{name} ({n_drugs} drugs)"
+            print(f"{label:<24}{old_us:>14.1f}us{new_us:>8.1f}us{len(body):>10}{gz:>10}{br:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -30,10 +30,15 @@ apiClient.interceptors.response.use(
 );
 
 
+// One search session per page load: the server narrows the previous candidate set
+// when the next query extends it ("war" -> "warf") instead of re-scanning every table
+const SEARCH_SESSION = (window.crypto?.randomUUID?.() || `${Date.now()}-${Math.random().toString(36).slice(2)}`);
+
 export const searchDrugs = async (query) => {
   try {
     const response = await apiClient.get('/search', { 
-      params: { q: query }
+      params: { q: query },
+      headers: { 'X-Search-Session': SEARCH_SESSION }
     });
     
     // Validate response data
@@ -1,8 +1,16 @@
 import sqlite3
 import pandas as pd
 import os
+import json
+import sys
 import numpy as np
 
+# Share the condensing rules with the backend (repo root on the path)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.backend.services.condense import condense_text
+from app.backend.services.documents import REFERENCE_SOURCES, encode_document
+from app.backend.config import CONTEXT_FIELD_TOKENS, REFERENCES_PER_TYPE
+
 # Configuration
 CSV_DIR = './drugbank_parsed_csvs_required_10'
 DB_FILE = 'req_10_sqlite_drugbank.db'
@@ -28,6 +36,9 @@ FILES_TO_PROCESS = {
     "references_links_drugbank_drugs.csv": "ref_links"
 }
 
+# Pharmacology fields the LLM prompts use, condensed into 'drug_context'
+CONTEXT_FIELDS = ["indication", "mechanism_of_action", "toxicity", "metabolism", "clearance", "half_life"]
+
 def clean_and_load(csv_name, table_name, conn):
     file_path = os.path.join(CSV_DIR, csv_name)
     
@@ -88,6 +99,91 @@ def add_indices(conn):
 
     conn.commit()
 
+def build_condensed_context(conn):
+    """
+    Precondenses pharmacology text to a fixed token budget per field so
+    prompt assembly doesn't ship thousands of characters per drug.
+    """
+    print(f"\nCondensing pharmacology context ({CONTEXT_FIELD_TOKENS} tokens/field)...")
+    try:
+        df = pd.read_sql(f"SELECT drugbank_id, {', '.join(CONTEXT_FIELDS)} FROM pharmacology", conn)
+    except Exception as e:
+        print(f"Condense Warning: {e}")
+        return
+
+    raw_chars = 0
+    condensed_chars = 0
+    for field in CONTEXT_FIELDS:
+        raw_chars += df[field].fillna("").str.len().sum()
+        df[field] = df[field].map(lambda v: condense_text(v, CONTEXT_FIELD_TOKENS) if v else None)
+        condensed_chars += df[field].fillna("").str.len().sum()
+
+    df.to_sql("drug_context", conn, if_exists='replace', index=False)
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_drug_context_pk ON drug_context(drugbank_id)")
+    conn.commit()
+    print(f"   -> Condensed {len(df)} drugs: {raw_chars:,} -> {condensed_chars:,} characters.")
+
+def _grouped_rows(conn, sql, limit=None):
+    """drugbank_id -> rows in table (rowid) order, optionally capped per drug."""
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    groups = {}
+    try:
+        for row in cursor.execute(sql):
+            rows = groups.setdefault(row['drugbank_id'], [])
+            if limit is None or len(rows) < limit:
+                rows.append(row)
+    except sqlite3.Error as e:
+        print(f"Document Warning: {e}")
+    return groups
+
+def build_drug_documents(conn):
+    """
+    Materializes one compressed JSON document per drug (food warnings, top
+    references per type, condensed context) so the API serves food, references
+    and context from a single indexed read instead of re-assembling rows.
+    """
+    print(f"\nMaterializing drug documents (top {REFERENCES_PER_TYPE} references per type)...")
+    general = _grouped_rows(conn, "SELECT drugbank_id, name, description FROM general_info ORDER BY rowid")
+    food = _grouped_rows(conn, "SELECT drugbank_id, interaction FROM food_interactions ORDER BY rowid")
+    contexts = _grouped_rows(conn, "SELECT * FROM drug_context") or _grouped_rows(conn, "SELECT * FROM pharmacology")
+    references = {
+        key: (_grouped_rows(conn, f"SELECT drugbank_id, {columns} FROM {table} ORDER BY rowid", REFERENCES_PER_TYPE), formatter)
+        for key, (table, columns, formatter) in REFERENCE_SOURCES.items()
+    }
+
+    documents = []
+    raw_bytes = 0
+    for drug_id, (info, *_) in general.items():
+        # Same shape as ClinicalSummarizer._load_drug_context, with the description condensed too
+        context = {
+            "name": info['name'],
+            "desc": condense_text(info['description'], CONTEXT_FIELD_TOKENS) if info['description'] else info['description']
+        }
+        if drug_id in contexts:
+            context.update({k: v for k, v in dict(contexts[drug_id][0]).items() if v})
+
+        doc = {
+            "name": info['name'],
+            "food": [r['interaction'] for r in food.get(drug_id, [])],
+            "references": {
+                key: [formatter(r) for r in rows.get(drug_id, [])]
+                for key, (rows, formatter) in references.items()
+            },
+            "context": context
+        }
+        blob = encode_document(doc)
+        raw_bytes += len(json.dumps(doc))
+        documents.append((drug_id, blob))
+
+    conn.execute("DROP TABLE IF EXISTS drug_documents")
+    conn.execute("CREATE TABLE drug_documents (drugbank_id TEXT, doc BLOB)")
+    conn.executemany("INSERT INTO drug_documents VALUES (?, ?)", documents)
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_drug_documents_pk ON drug_documents(drugbank_id)")
+    conn.commit()
+    stored = sum(len(blob) for _, blob in documents)
+    print(f"   -> {len(documents)} documents: {raw_bytes:,} bytes of JSON -> {stored:,} bytes compressed.")
+
 # Execution
 if __name__ == "__main__":
     if os.path.exists(DB_FILE):
@@ -107,6 +203,8 @@ if __name__ == "__main__":
         clean_and_load(csv, table, conn)
         
     add_indices(conn)
+    build_condensed_context(conn)
+    build_drug_documents(conn)
     
     conn.close()
     print("-" * 40)